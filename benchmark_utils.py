@@ -0,0 +1,280 @@
+import json
+import tempfile
+from collections import namedtuple
+from math import log2
+from time import perf_counter
+from numpy import polyfit, log, abs, asarray
+from numpy.random import default_rng
+from os.path import exists
+from constants import COMPLETE, COMPLETE_BIPARTITE, STAR, PATH, CYCLE, HYPER_CUBE, RANDOM_BINOMIAL, WHEEL,\
+    NODE, EDGE, INCREMENTAL, COMPONENT, WARM, REDUCED_SPECTRAL_SIMILARITY,\
+    IRRECONCILABLE_SPECTRAL_DIFFERENCE, TOTAL_SPECTRAL_SIMILARITY, NORMALIZED_EIGENCENTRALITIES
+from graph_wrappers import graph_wrapper_dict, graph_spec_dict
+from graph_wrapper_def import graph_wrapper, apply_perturbation_sequences
+from experiment_def import experiment
+
+benchmark_result = namedtuple("benchmark_result", ["graph_family", "perturbation_type", "stage", "sizes", "seconds", "exponent"])
+engine_comparison = namedtuple("engine_comparison", ["graph_family", "perturbation_type", "size", "variant", "speedup", "max_difference"])
+
+#
+# Graph kwargs of roughly size nodes for every family
+benchmark_kwargs_dict = {
+    COMPLETE: lambda size: {"num_nodes": size},
+    COMPLETE_BIPARTITE: lambda size: {"num_nodes_C1": size // 2, "num_nodes_C2": size - size // 2},
+    STAR: lambda size: {"num_leaves": size - 1},
+    PATH: lambda size: {"num_nodes": size},
+    CYCLE: lambda size: {"num_nodes": size},
+    HYPER_CUBE: lambda size: {"cube_degree": int(round(log2(size)))},
+    RANDOM_BINOMIAL: lambda size: {"num_nodes": size, "edge_prob": 0.5, "seed": 0},
+    WHEEL: lambda size: {"num_spokes": size}
+}
+
+#
+# Engines checked against the dense path (graph_wrapper kwargs)
+engine_variants = {
+    INCREMENTAL: {"spectral_engine": INCREMENTAL},
+    COMPONENT: {"spectral_engine": COMPONENT},
+    WARM: {"centrality_engine": WARM},
+    "batched": {}
+}
+
+# Stages timed for every family, perturbation type and size
+CONSTRUCTION = "construction"
+SEQUENCE = "sequence"
+LOAD = "load"
+
+# Quantities compared between engines
+compared_metrics = [REDUCED_SPECTRAL_SIMILARITY, IRRECONCILABLE_SPECTRAL_DIFFERENCE, TOTAL_SPECTRAL_SIMILARITY, NORMALIZED_EIGENCENTRALITIES]
+
+
+def time_call(f, repeats=3):
+    #
+    # The minimum is the least noisy estimate
+    seconds = []
+    for r in range(repeats):
+        start = perf_counter()
+        f()
+        seconds.append(perf_counter() - start)
+    #
+    return min(seconds)
+
+
+def get_scaling_exponent(sizes, seconds):
+    '''
+    Returns the empirical scaling exponent k of seconds ~ sizes**k, fitted
+    by least squares in log-log space.
+    '''
+    #
+    if len(sizes) < 2:
+        return None
+    #
+    return float(polyfit(log(asarray(sizes, dtype=float)), log(asarray(seconds)), 1)[0])
+
+
+def run_sequence(graph_wrapper, perturbation_type, seed=0):
+    #
+    graph_wrapper.apply_perturbation_sequence(perturbation_type=perturbation_type, rng=default_rng(seed))
+    #
+    return graph_wrapper.perturbed_spectra_info
+
+
+def benchmark_case(graph_family, perturbation_type, size, repeats=3, load_samples=100):
+    '''
+    Returns the seconds of constructing the graph_wrapper, of a full
+    perturbation sequence (with a fixed removal order) and of
+    load_experiment over load_samples recorded copies of that sequence.
+    '''
+    #
+    # Imported here since visualization_utils sets up plots on import
+    import visualization_utils
+    kwargs = benchmark_kwargs_dict[graph_family](size)
+    seconds = {}
+    seconds[CONSTRUCTION] = time_call(lambda: graph_wrapper_dict[graph_family](**kwargs), repeats)
+    graph_wrapper = graph_wrapper_dict[graph_family](**kwargs)
+    seconds[SEQUENCE] = time_call(lambda: run_sequence(graph_wrapper, perturbation_type), repeats)
+    #
+    # Load from a scratch data root (load_experiment takes no seed)
+    load_kwargs = dict((k, v) for k, v in kwargs.items() if k != "seed")
+    with tempfile.TemporaryDirectory() as data_root:
+        exp = experiment(graph_family=graph_family, perturbation_type=perturbation_type, data_root=data_root, overwrite=True, **load_kwargs)
+        exp.record_samples(0, [graph_wrapper.perturbed_spectra_info] * load_samples)
+
+        def load():
+            visualization_utils.trajectory_cache.clear()
+            visualization_utils.load_experiment(graph_family=graph_family, perturbation_type=perturbation_type, data_root=data_root, **load_kwargs)
+        seconds[LOAD] = time_call(load, repeats)
+    #
+    return seconds
+
+
+def run_scaling_benchmarks(graph_families=None, perturbation_types=[NODE, EDGE], sizes=[8, 16, 32, 64], repeats=3):
+    '''
+    Times every stage of every graph family (default: all of
+    graph_wrapper_dict) and perturbation type at the given sizes, which
+    should grow geometrically, and fits the scaling exponent of each.
+    Returns a list of benchmark_result.
+    '''
+    #
+    graph_families = list(graph_wrapper_dict) if graph_families is None else graph_families
+    results = []
+    for graph_family in graph_families:
+        for perturbation_type in perturbation_types:
+            seconds = dict((stage, []) for stage in [CONSTRUCTION, SEQUENCE, LOAD])
+            for size in sizes:
+                for stage, s in benchmark_case(graph_family, perturbation_type, size, repeats).items():
+                    seconds[stage].append(s)
+                #
+            #
+            for stage in seconds:
+                results.append(benchmark_result(graph_family, perturbation_type, stage, list(sizes), seconds[stage], get_scaling_exponent(sizes, seconds[stage])))
+                print(f"{graph_family:>20} {perturbation_type:>5} {stage:>12}: " + " ".join(f"{s:9.2e}" for s in seconds[stage]) + f"  (exponent {results[-1].exponent:.2f})")
+            #
+        #
+    #
+    return results
+
+
+def get_max_difference(info, reference):
+    #
+    # Over all steps of all compared quantities
+    difference = 0.0
+    for metric in compared_metrics:
+        for a, b in zip(info[metric], reference[metric]):
+            difference = max(difference, float(abs(asarray(a, dtype=float) - asarray(b, dtype=float)).max()))
+        #
+    #
+    return difference
+
+
+def get_engine_run(spec, engine_kwargs, perturbation_type, batch_size=1):
+    '''
+    Returns a function running the perturbation sequence (with a fixed
+    removal order) on fresh graph_wrappers with engine_kwargs and
+    returning the perturbed_spectra_info of the first. With batch_size >
+    1, that many sequences run batched (see apply_perturbation_sequences).
+    '''
+    #
+    graph_wrappers = [graph_wrapper(**spec, **engine_kwargs) for b in range(batch_size)]
+
+    def run():
+        if batch_size > 1:
+            apply_perturbation_sequences(graph_wrappers, perturbation_type, [default_rng(0) for b in range(batch_size)])
+        else:
+            run_sequence(graph_wrappers[0], perturbation_type)
+        return graph_wrappers[0].perturbed_spectra_info
+    #
+    return run
+
+
+def compare_engines(graph_families=None, perturbation_types=[NODE, EDGE], size=32, repeats=7, batch_size=4):
+    '''
+    Runs the same perturbation sequences with every engine variant (see
+    engine_variants) and with the dense path, and returns a list of
+    engine_comparison: the speedup over dense and the largest difference
+    in the metrics and eigencentralities along the sequence. Engines are
+    built for large or fragmenting graphs, so at small sizes most lose to
+    dense; they are checked against their own baselines (see
+    check_engines) rather than against a fixed speedup.
+    '''
+    #
+    graph_families = list(graph_wrapper_dict) if graph_families is None else graph_families
+    comparisons = []
+    for graph_family in graph_families:
+        for perturbation_type in perturbation_types:
+            spec = graph_spec_dict[graph_family](**benchmark_kwargs_dict[graph_family](size))._asdict()
+            runs = {"dense": get_engine_run(spec, {}, perturbation_type)}
+            for variant, engine_kwargs in engine_variants.items():
+                runs[variant] = get_engine_run(spec, engine_kwargs, perturbation_type, batch_size if variant == "batched" else 1)
+            #
+            # Every path runs once untimed, so that none is timed cold,
+            # and the repeats are interleaved, so that a slow spell of the
+            # machine slows dense and the engines alike
+            infos = dict((variant, run()) for variant, run in runs.items())
+            seconds = dict((variant, []) for variant in runs)
+            for r in range(repeats):
+                for variant, run in runs.items():
+                    seconds[variant].append(time_call(run, 1))
+                #
+            #
+            dense_seconds = min(seconds["dense"])
+            for variant in engine_variants:
+                speedup = dense_seconds / (min(seconds[variant]) / (batch_size if variant == "batched" else 1))
+                comparisons.append(engine_comparison(graph_family, perturbation_type, size, variant, speedup, get_max_difference(infos[variant], infos["dense"])))
+                print(f"{graph_family:>20} {perturbation_type:>5} {variant:>12}: speedup {comparisons[-1].speedup:6.2f}, max difference {comparisons[-1].max_difference:.1e}")
+            #
+        #
+    #
+    return comparisons
+
+
+def check_engines(file_name, comparisons, tolerance=0.4, max_difference=1e-8):
+    '''
+    Compares engine comparisons (see compare_engines) with the baselines
+    in file_name (see save_baselines) and returns a list of regression
+    messages: any engine whose speedup over dense fell more than
+    tolerance (a fraction) below its baseline at the same size, or whose
+    results differ from dense by more than max_difference beyond its
+    baseline difference (some engines legitimately disagree, e.g. the
+    warm centrality where the leading eigenvalue is degenerate). Speedups
+    of sequences of a few milliseconds vary by up to a third between
+    runs, so the default tolerance only flags engines that lost close to
+    half their speedup.
+    '''
+    #
+    if not exists(file_name):
+        return []
+    with open(file_name, 'r') as f:
+        baselines = json.load(f)
+    regressions = []
+    for c in comparisons:
+        key = f"{c.graph_family}/{c.perturbation_type}/{c.variant}"
+        if key not in baselines or baselines[key]["size"] != c.size:
+            continue
+        baseline = baselines[key]
+        if c.speedup < (1 - tolerance) * baseline["speedup"]:
+            regressions.append(f"{key} at size {c.size}: speedup {c.speedup:.2f} over dense vs. baseline {baseline['speedup']:.2f}")
+        if c.max_difference > baseline["max_difference"] + max_difference:
+            regressions.append(f"{key} at size {c.size}: differs from dense by {c.max_difference:.1e} vs. baseline {baseline['max_difference']:.1e}")
+        #
+    #
+    return regressions
+
+
+def save_baselines(file_name, results, comparisons=[]):
+    #
+    # Engine comparisons are keyed by variant rather than stage
+    baselines = dict((f"{r.graph_family}/{r.perturbation_type}/{r.stage}", r._asdict()) for r in results)
+    baselines.update((f"{c.graph_family}/{c.perturbation_type}/{c.variant}", c._asdict()) for c in comparisons)
+    with open(file_name, 'w') as f:
+        json.dump(baselines, f, indent=1)
+    #
+    return
+
+
+def check_baselines(file_name, results, tolerance=0.25, exponent_tolerance=0.3):
+    '''
+    Compares results with the baselines in file_name and returns a list
+    of regression messages: any size more than tolerance (a fraction)
+    slower than its baseline, or a scaling exponent more than
+    exponent_tolerance above it.
+    '''
+    #
+    if not exists(file_name):
+        return []
+    with open(file_name, 'r') as f:
+        baselines = json.load(f)
+    regressions = []
+    for r in results:
+        key = f"{r.graph_family}/{r.perturbation_type}/{r.stage}"
+        if key not in baselines:
+            continue
+        baseline = baselines[key]
+        baseline_seconds = dict(zip(baseline["sizes"], baseline["seconds"]))
+        for size, seconds in zip(r.sizes, r.seconds):
+            if size in baseline_seconds and seconds > (1 + tolerance) * baseline_seconds[size]:
+                regressions.append(f"{key} at size {size}: {seconds:.2e}s vs. baseline {baseline_seconds[size]:.2e}s")
+        if r.exponent is not None and baseline["exponent"] is not None and r.exponent > baseline["exponent"] + exponent_tolerance:
+            regressions.append(f"{key}: scaling exponent {r.exponent:.2f} vs. baseline {baseline['exponent']:.2f}")
+        #
+    #
+    return regressions
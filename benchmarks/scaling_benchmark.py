@@ -0,0 +1,48 @@
+#
+#
+if __name__ == "__main__":
+    #
+    # Get utility libs
+    import sys
+    import os
+    #
+    # Add main folder to path dynamically
+    x = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.append(x)
+    #
+    from benchmark_utils import run_scaling_benchmarks, compare_engines, check_engines, save_baselines, check_baselines
+    from constants import NODE, EDGE
+    #
+    # Ignore matplotlib and numpy warnings
+    import warnings
+    warnings.filterwarnings("ignore")
+    import matplotlib
+    matplotlib.use("Agg")
+    #
+    # Define params (sizes grow geometrically)
+    perturbation_types = [NODE, EDGE]
+    sizes = [8, 16, 32, 64]
+    repeats = 3
+    engine_size = 32
+    engine_repeats = 7
+    baselines_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+    update_baselines = "--update-baselines" in sys.argv
+    #
+    # Time construction, sequences and loading at every size
+    print("Scaling (seconds per size, fitted exponent)")
+    results = run_scaling_benchmarks(perturbation_types=perturbation_types, sizes=sizes, repeats=repeats)
+    #
+    # Check the engines against the dense path
+    print(f"\nEngines against dense (size {engine_size})")
+    comparisons = compare_engines(perturbation_types=perturbation_types, size=engine_size, repeats=engine_repeats)
+    #
+    # Flag regressions against the baselines of this machine, including
+    # engines that lost ground to (or disagree more with) the dense path
+    regressions = check_baselines(baselines_file, results) + check_engines(baselines_file, comparisons)
+    print(f"\n{len(regressions)} regressions")
+    for regression in regressions:
+        print(regression)
+    if update_baselines or not os.path.exists(baselines_file):
+        save_baselines(baselines_file, results, comparisons)
+        print(f"Saved baselines to {baselines_file}")
+    #
@@ -0,0 +1,201 @@
+from numbers import Integral
+from math import comb
+from numpy import arange, cos, sin, pi, sqrt, repeat, concatenate, sort, full, zeros
+from constants import COMPLETE, COMPLETE_BIPARTITE, STAR, PATH, CYCLE,\
+    HYPER_CUBE, WHEEL
+
+
+def is_size(n, minimum):
+    return isinstance(n, Integral) and n >= minimum
+
+
+def get_complete_spectrum(n):
+    #
+    # K_n: 0, n with multiplicity n - 1
+    if not is_size(n, 2):
+        return None
+    #
+    return concatenate([zeros(1), full(n - 1, float(n))])
+
+
+def get_complete_bipartite_spectrum(n1, n2):
+    #
+    # K_{a,b}: 0, a with multiplicity b - 1, b with multiplicity a - 1, a + b
+    if not (is_size(n1, 1) and is_size(n2, 1)):
+        return None
+    #
+    return concatenate([zeros(1), full(n2 - 1, float(n1)), full(n1 - 1, float(n2)), full(1, float(n1 + n2))])
+
+
+def get_star_spectrum(n):
+    #
+    # S_k = K_{1,k}: 0, 1 with multiplicity k - 1, k + 1
+    if not is_size(n, 1):
+        return None
+    #
+    return get_complete_bipartite_spectrum(1, n)
+
+
+def get_path_spectrum(n):
+    #
+    # P_n: 2 - 2 cos(pi j / n), j = 0, ..., n - 1
+    if not is_size(n, 2):
+        return None
+    #
+    return 2.0 - 2.0 * cos(pi * arange(n) / n)
+
+
+def get_cycle_spectrum(n):
+    #
+    # C_n: 2 - 2 cos(2 pi j / n), j = 0, ..., n - 1
+    if not is_size(n, 3):
+        return None
+    #
+    return 2.0 - 2.0 * cos(2.0 * pi * arange(n) / n)
+
+
+def get_hyper_cube_spectrum(n):
+    #
+    # Q_d: 2 i with multiplicity (d choose i), i = 0, ..., d
+    if not is_size(n, 1):
+        return None
+    #
+    return repeat(2.0 * arange(n + 1), [comb(n, i) for i in range(n + 1)])
+
+
+def get_wheel_spectrum(n):
+    #
+    # W_n (hub plus a rim cycle of m = n - 1 nodes): 0, n and
+    # 3 - 2 cos(2 pi j / m), j = 1, ..., m - 1
+    if not is_size(n, 4):
+        return None
+    #
+    m = n - 1
+    #
+    return concatenate([zeros(1), full(1, float(n)), 3.0 - 2.0 * cos(2.0 * pi * arange(1, m) / m)])
+
+
+#
+# Construct closed-form spectrum dict, keyed like graph_dict
+# and called with the same arguments as its generators
+closed_form_spectrum_dict = {
+    COMPLETE: get_complete_spectrum,
+    COMPLETE_BIPARTITE: get_complete_bipartite_spectrum,
+    STAR: get_star_spectrum,
+    PATH: get_path_spectrum,
+    CYCLE: get_cycle_spectrum,
+    HYPER_CUBE: get_hyper_cube_spectrum,
+    WHEEL: get_wheel_spectrum,
+}
+
+
+def get_closed_form_spectrum(graph_family, args=[], kwargs={}):
+    '''
+    Laplacian spectrum, in descending order, of
+    graph_dict[graph_family](*args, **kwargs), or None if it has no closed
+    form (random graphs, or sizes too small for the formulas to apply).
+    '''
+    #
+    if graph_family not in closed_form_spectrum_dict:
+        return None
+    #
+    spectrum = closed_form_spectrum_dict[graph_family](*args, **kwargs)
+    if spectrum is None:
+        return None
+    #
+    return sort(spectrum)[::-1]
+
+
+def get_complete_eigencentrality(n):
+    #
+    # Vertex-transitive, so uniform
+    if not is_size(n, 2):
+        return None
+    #
+    return full(n, 1.0)
+
+
+def get_complete_bipartite_eigencentrality(n1, n2):
+    #
+    # K_{a,b} (the a nodes first): sqrt(b) on the a side, sqrt(a) on the other
+    if not (is_size(n1, 1) and is_size(n2, 1)):
+        return None
+    #
+    return concatenate([full(n1, sqrt(n2)), full(n2, sqrt(n1))])
+
+
+def get_star_eigencentrality(n):
+    #
+    # S_k = K_{1,k}, hub first
+    if not is_size(n, 1):
+        return None
+    #
+    return get_complete_bipartite_eigencentrality(1, n)
+
+
+def get_path_eigencentrality(n):
+    #
+    # P_n: sin(pi (i + 1) / (n + 1)), i = 0, ..., n - 1
+    if not is_size(n, 2):
+        return None
+    #
+    return sin(pi * arange(1, n + 1) / (n + 1))
+
+
+def get_cycle_eigencentrality(n):
+    #
+    # Vertex-transitive, so uniform
+    if not is_size(n, 3):
+        return None
+    #
+    return full(n, 1.0)
+
+
+def get_hyper_cube_eigencentrality(n):
+    #
+    # Vertex-transitive, so uniform
+    if not is_size(n, 1):
+        return None
+    #
+    return full(2 ** n, 1.0)
+
+
+def get_wheel_eigencentrality(n):
+    #
+    # W_n (hub first, then a rim of m = n - 1 nodes): the hub has
+    # sqrt(m + 1) - 1 times the centrality of a rim node
+    if not is_size(n, 4):
+        return None
+    #
+    return concatenate([full(1, sqrt(n) - 1.0), full(n - 1, 1.0)])
+
+
+#
+# Construct closed-form eigencentrality dict, keyed like graph_dict,
+# with nodes in the order of its generators
+closed_form_eigencentrality_dict = {
+    COMPLETE: get_complete_eigencentrality,
+    COMPLETE_BIPARTITE: get_complete_bipartite_eigencentrality,
+    STAR: get_star_eigencentrality,
+    PATH: get_path_eigencentrality,
+    CYCLE: get_cycle_eigencentrality,
+    HYPER_CUBE: get_hyper_cube_eigencentrality,
+    WHEEL: get_wheel_eigencentrality,
+}
+
+
+def get_closed_form_eigencentrality(graph_family, args=[], kwargs={}):
+    '''
+    Normalized eigencentrality (leading adjacency eigenvector, summing
+    to one) of graph_dict[graph_family](*args, **kwargs), or None if it
+    has no closed form.
+    '''
+    #
+    if graph_family not in closed_form_eigencentrality_dict:
+        return None
+    #
+    e = closed_form_eigencentrality_dict[graph_family](*args, **kwargs)
+    if e is None:
+        return None
+    #
+    return e / e.sum()
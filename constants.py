@@ -1,6 +1,5 @@
 import networkx as nx
 from os.path import dirname, join, abspath
-from matplotlib import pyplot as plt
 
 #
 # Construct graph family dict
@@ -32,6 +31,26 @@ ADJACENCY = "adjacency"
 NODE = "node"
 EDGE = "edge"
 #
+# Spectral engine specifications
+DENSE = "dense"
+INCREMENTAL = "incremental"
+COMPONENT = "component"
+#
+# Centrality engine specifications
+WARM = "warm"
+#
+# Target spectrum specifications
+CLOSED_FORM = "closed_form"
+NUMERIC = "numeric"
+VALIDATE = "validate"
+#
+# Timing stage specifications
+PERTURB_STAGE = "perturb"
+SPECTRUM_STAGE = "spectrum"
+CENTRALITY_STAGE = "centrality"
+METRICS_STAGE = "metrics"
+RECORD_STAGE = "record"
+#
 # Graph specifications
 TARGET = "target"
 PERTURBED = "perturbed"
@@ -51,10 +70,15 @@ HYPER_CUBE = "hyper_cube"
 RANDOM_BINOMIAL = "random_binomial"
 WHEEL = "wheel"
 #
+# Graph families that do not involve a random draw,
+# i.e. whose graphs only depend on their parameters
+deterministic_graph_families = set([COMPLETE, COMPLETE_BIPARTITE, STAR, PATH, CYCLE, HYPER_CUBE, WHEEL])
+#
 # Create relative absolute path
 # to data dir for easy read/write
 root_dir = dirname(abspath(__file__))
 data_dir = join(root_dir, "data")
+seeds_file = join(root_dir, "seeds.csv")
 #
 # Perturbed Data Keys
 BULK_INDICES = "bulk_indices"
@@ -63,14 +87,25 @@ SPECTRA = "spectra"
 REDUCED_SPECTRAL_SIMILARITY = "rss"
 IRRECONCILABLE_SPECTRAL_DIFFERENCE = "isd"
 TOTAL_SPECTRAL_SIMILARITY = "tss"
+PERTURBATION_ORDER = "perturbation_order"
+STEP_INDICES = "step_indices"
+#
+# Values with which shorter trajectories of each metric are
+# padded to the longest, i.e. those of a degenerate graph
+metric_fill_values = {
+    REDUCED_SPECTRAL_SIMILARITY: 0,
+    IRRECONCILABLE_SPECTRAL_DIFFERENCE: 1,
+    TOTAL_SPECTRAL_SIMILARITY: 0
+}
 #
-# Color maps for different metrics
+# Color maps for different metrics (by name, so that
+# matplotlib is only loaded once something is drawn)
 metric_color_maps = {
-    REDUCED_SPECTRAL_SIMILARITY: plt.get_cmap('PuBu'),
-    IRRECONCILABLE_SPECTRAL_DIFFERENCE: plt.get_cmap('YlGn'),
-    TOTAL_SPECTRAL_SIMILARITY: plt.get_cmap('YlOrRd')
+    REDUCED_SPECTRAL_SIMILARITY: 'PuBu',
+    IRRECONCILABLE_SPECTRAL_DIFFERENCE: 'YlGn',
+    TOTAL_SPECTRAL_SIMILARITY: 'YlOrRd'
 }
 
 misc_color_maps = {
-    "YlGnBu": plt.get_cmap('YlGnBu')
+    "YlGnBu": 'YlGnBu'
 }
@@ -6,16 +6,32 @@ Created on Dec 10, 2017
 import errno
 from constants import COMPLETE, EDGE, COMPLETE_BIPARTITE,\
     REDUCED_SPECTRAL_SIMILARITY, IRRECONCILABLE_SPECTRAL_DIFFERENCE,\
-    TOTAL_SPECTRAL_SIMILARITY, SPECTRA, NORMALIZED_EIGENCENTRALITIES, STAR, NODE
+    TOTAL_SPECTRAL_SIMILARITY, SPECTRA, NORMALIZED_EIGENCENTRALITIES, STAR, NODE,\
+    DENSE, deterministic_graph_families, PERTURBATION_ORDER, seeds_file, metric_fill_values,\
+    RECORD_STAGE, BULK_INDICES, STEP_INDICES, data_dir
 from graph_wrappers import graph_wrapper_dict
-from utils import get_data_dir, dump_one_d_data, dump_two_d_data, remove_file
+from graph_wrapper_def import apply_perturbation_sequences, assess_trajectories
+from copy import copy
+from numpy.random import SeedSequence, default_rng
+from zlib import crc32
+from numpy import float64, int64, arange, diff, zeros
+from numpy import dtype as npdtype
+from utils import get_data_dir, remove_file, read_rand_seeds, dump_json
+from trajectory_store_def import trajectory_store, trajectory_dtypes, adopt_legacy_dir
+from spectra_archive_def import spectra_archive
+from step_statistics_def import step_statistics, save_summary, load_summary, update_step_axis, load_step_axis
+from stage_timer_def import stage_timer, null_timer
+from time import perf_counter
 from os.path import join
+from glob import glob
 
 
 class experiment(object):
     #
     #
-    def __init__(self, graph_family=None, perturbation_type=None, **kwargs):
+    def __init__(self, graph_family=None, perturbation_type=None, spectral_engine=DENSE, spectral_engine_kwargs=None,
+                 centrality_engine=DENSE, centrality_engine_kwargs=None, seed=None, spectra_dtype=float64,
+                 record=True, overwrite=False, timing=False, stride=1, fractions=None, data_root=data_dir, **kwargs):
         '''
         Different graph families take different optional kwargs:
             - complete <== num_nodes
@@ -26,63 +42,423 @@ class experiment(object):
             - hyper_cube <== cube_degree
             - random_binomial <== num_nodes, edge_prob
             - wheel <== num_spokes
+
+        The perturbed spectra are computed by spectral_engine (see
+        spectral_engines.spectral_engine_dict), which is built with
+        spectral_engine_kwargs, e.g. {"tolerance": 1e-10}. Likewise for
+        the perturbed eigencentralities and centrality_engine (see
+        centrality_engines.centrality_engine_dict).
+
+        Every sample draws its graph and removal order from its own random
+        streams, derived from seed (an int or list of ints; default: the
+        seeds in seeds.csv), the experiment and the sample index (see
+        get_sample_streams). Any sample can thus be recomputed on its own,
+        with the same result however the samples are split up.
+
+        The perturbed spectra and eigencentralities of every step are
+        packed into one archive each (see spectra_archive_def), as
+        spectra_dtype values; float32 halves them.
+
+        Every recorded sample is checkpointed (see record_samples). Samples
+        already recorded in data_dir are kept, and perform only computes
+        the missing ones, be it to recover from a crash or to add samples
+        to an existing run. Data recorded before experiments were
+        checkpointed is adopted as it is (see
+        trajectory_store_def.adopt_legacy_dir). Data recorded with another
+        seed or spectra_dtype cannot be extended and raises an exception;
+        with overwrite=True, existing data files are removed instead.
+
+        While recording, running statistics of each metric at every step
+        are kept (see step_statistics_def) and saved to summary.npz by
+        perform, along with the step axis, for plots that only need
+        those.
+
+        With timing=True, the stages of every step of every sample are
+        timed (see stage_timer_def), and their totals per step and per
+        stage are saved to timing.json and timing.csv by perform, to see
+        which stage dominates (and where along the sequence).
+
+        With stride or fractions, every removal is still applied, but the
+        perturbed graphs are only assessed after every stride-th removal
+        or at the given fractions of the removals (see
+        graph_wrapper_def.get_evaluation_steps), which saves most of the
+        eigensolves on large sequences. The removals at which each sample
+        was assessed are stored as its step indices. Data recorded with
+        other settings cannot be extended.
+
+        Data is stored under data_root/<family>/<perturbation>/<name>.
+
+        With record=False, existing data files are left alone; this is for
+        experiments whose samples are recorded elsewhere (see sweep_utils).
         '''
         #
         # Set defining options
         self.graph_family = graph_family
         self.perturbation_type = perturbation_type
+        self.spectral_engine = spectral_engine
+        self.spectral_engine_kwargs = {} if spectral_engine_kwargs is None else spectral_engine_kwargs
+        self.centrality_engine = centrality_engine
+        self.centrality_engine_kwargs = {} if centrality_engine_kwargs is None else centrality_engine_kwargs
+        self.spectra_dtype = npdtype(spectra_dtype)
+        self.record = record
+        self.timing = timing
+        self.stride = stride
+        self.fractions = None if fractions is None else [float(f) for f in fractions]
+        self.timer = stage_timer() if timing else null_timer()
         self.graph_generator = graph_wrapper_dict[graph_family]
         self.kwargs = kwargs
         self.graph_wrapper = self.graph_generator(**self.kwargs)
-        self.data_dir = get_data_dir(self.graph_family, self.graph_wrapper.name, self.perturbation_type)
+        self.data_dir = get_data_dir(self.graph_family, self.graph_wrapper.name, self.perturbation_type, data_root)
+        #
+        # Set the random streams
+        self.seed = read_rand_seeds(seeds_file) if seed is None else seed
+        self.stream_key = crc32(f"{self.graph_family}/{self.graph_wrapper.name}/{self.perturbation_type}".encode())
         #
         # Define files where data will be stored
-        self.initialize_files()
+        self.legacy_samples = 0
+        self.initialize_files(remove_existing=(record and overwrite))
+        self.num_recorded = self.restore_checkpoint() if record else 0
+        self.statistics = self.restore_statistics() if record else None
+        self.step_axis = self.restore_step_axis() if record else None
+        #
+        return
+
+    def get_sample_graph_wrapper(self, graph_seed=None):
+        #
+        # Only random graphs need a new target for every sample; otherwise
+        # a copy shares the existing target and only resets the perturbed state
+        if self.graph_family in deterministic_graph_families:
+            graph_wrapper = copy(self.graph_wrapper)
+        else:
+            graph_wrapper = self.graph_generator(seed=graph_seed, **self.kwargs)
+        #
+        graph_wrapper.set_spectral_engine(self.spectral_engine, **self.spectral_engine_kwargs)
+        graph_wrapper.set_centrality_engine(self.centrality_engine, **self.centrality_engine_kwargs)
+        graph_wrapper.set_timer(self.timer)
+        #
+        return graph_wrapper
+
+    def get_sample_streams(self, i):
+        '''
+        Returns the random streams of sample i: an integer seed for the
+        graph generator and a numpy Generator for the removal order. Both
+        are derived from (seed, stream_key, i) alone, independently of
+        every other sample.
+        '''
+        #
+        sample_sequence = SeedSequence(self.seed, spawn_key=(self.stream_key, i))
+        graph_sequence, order_sequence = sample_sequence.spawn(2)
+        #
+        return int(graph_sequence.generate_state(1)[0]), default_rng(order_sequence)
+
+    def initialize_files(self, remove_existing=True):
+        #
+        # The trajectories of all samples go into binary stores (see
+        # trajectory_store_def), which replace the former csv files
+        self.rss_store = trajectory_store(join(self.data_dir, "rss"), trajectory_dtypes["rss"])
+        self.isd_store = trajectory_store(join(self.data_dir, "isd"), trajectory_dtypes["isd"])
+        self.tss_store = trajectory_store(join(self.data_dir, "tss"), trajectory_dtypes["tss"])
+        self.bulk_indices_store = trajectory_store(join(self.data_dir, "bulk_indices"), trajectory_dtypes["bulk_indices"])
+        self.perturbation_orders_store = trajectory_store(join(self.data_dir, "perturbation_orders"), trajectory_dtypes["perturbation_orders"])
+        self.step_indices_store = trajectory_store(join(self.data_dir, "step_indices"), trajectory_dtypes["step_indices"])
+        self.spectra_archive = spectra_archive(join(self.data_dir, "spectra"), self.spectra_dtype)
+        self.normalized_eigencentralities_archive = spectra_archive(join(self.data_dir, "normalized_eigencentralities"), self.spectra_dtype)
+        self.checkpoint_file = join(self.data_dir, "checkpoint.json")
+        self.summary_file = join(self.data_dir, "summary.npz")
+        #
+        # Remove since the stores and archives are appended
+        # to (along with any csv files they replace)
+        if remove_existing:
+            self.rss_store.remove()
+            self.isd_store.remove()
+            self.tss_store.remove()
+            self.bulk_indices_store.remove()
+            self.perturbation_orders_store.remove()
+            self.step_indices_store.remove()
+            self.spectra_archive.remove()
+            self.normalized_eigencentralities_archive.remove()
+            remove_file(self.checkpoint_file)
+            remove_file(self.summary_file)
+            for name in trajectory_dtypes:
+                remove_file(join(self.data_dir, name + ".csv"))
+            for file_name in glob(join(self.data_dir, "*_sample_*.csv")):
+                remove_file(file_name)
+        #
+        return
+
+    def perform(self, num_samples=None, batch_size=1, target_width=None, metric=TOTAL_SPECTRAL_SIMILARITY, confidence=0.95,
+                min_samples=10, samples_per_check=10):
+        '''
+        Performs the experiment until num_samples samples are recorded.
+
+        With a target_width, num_samples is only the maximum: samples are
+        added samples_per_check at a time until the confidence interval
+        (at the given confidence) of the mean of metric is at most
+        target_width wide at every step, but at least min_samples are
+        recorded. Returns whether the target was met (always True without
+        one). Samples are recorded, and checkpointed, samples_per_check at
+        a time, so an interrupted run loses at most that many. Experiments
+        with record=False cannot be performed.
+        '''
+        #
+        # Nothing can be performed without recording (nor adaptively
+        # without the running statistics that come with it)
+        if not self.record:
+            raise Exception("%s is not recorded (record=False), so it cannot be performed; use run_samples instead." % self.graph_wrapper.name)
+        #
+        while self.num_recorded < num_samples:
+            if target_width is not None and self.num_recorded >= min_samples and self.get_confidence_width(metric, confidence) <= target_width:
+                break
+            #
+            # Fixed runs go to num_samples in one go
+            first_sample = self.num_recorded
+            stop = num_samples if target_width is None else min(num_samples, max(first_sample + samples_per_check, min_samples))
+            perturbed_spectra_infos = []
+            for perturbed_spectra_info in self.run_samples(stop - first_sample, batch_size, first_sample):
+                perturbed_spectra_infos.append(perturbed_spectra_info)
+                if len(perturbed_spectra_infos) == samples_per_check:
+                    self.record_samples(self.num_recorded, perturbed_spectra_infos)
+                    perturbed_spectra_infos = []
+                #
+            if len(perturbed_spectra_infos) > 0:
+                self.record_samples(self.num_recorded, perturbed_spectra_infos)
+            #
+        #
+        self.save_summary()
+        self.save_timing()
+        #
+        return target_width is None or self.get_confidence_width(metric, confidence) <= target_width
+
+    def get_confidence_width(self, metric=TOTAL_SPECTRAL_SIMILARITY, confidence=0.95):
+        #
+        # The widest confidence interval of the mean of metric over all steps
+        widths = self.statistics[metric].get_confidence_width(confidence)
+        #
+        return widths.max() if len(widths) > 0 else 0.0
+
+    def recompute_metrics(self, sample_indices=None):
+        '''
+        Recomputes the metrics of recorded samples (default: all) from
+        their stored spectra, in one vectorized pass and without rerunning
+        any perturbations. Returns one perturbed_spectra_info per sample,
+        holding its spectra and metrics.
+        '''
+        #
+        sample_indices = range(self.num_recorded) if sample_indices is None else sample_indices
+        graph_wrappers = []
+        for i in sample_indices:
+            if i < self.legacy_samples:
+                raise Exception("Sample %s predates the spectra archive; only samples from %s on can be recomputed." % (i, self.legacy_samples))
+            graph_wrapper = self.get_sample_graph_wrapper(self.get_sample_streams(i)[0])
+            graph_wrapper.init_perturbed_graph()
+            info = graph_wrapper.perturbed_spectra_info
+            #
+            # The target and the degenerate last step are not assessed
+            spectra = self.spectra_archive.get_sample(i)
+            info[SPECTRA] = [info[SPECTRA][0]] + [spectrum.astype(float64) for spectrum in spectra[1:-1]] + [[0]]
+            num_assessed = len(spectra) - 2
+            info[BULK_INDICES] += [None] * num_assessed + [0]
+            info[REDUCED_SPECTRAL_SIMILARITY] += [None] * num_assessed + [0]
+            info[IRRECONCILABLE_SPECTRAL_DIFFERENCE] += [None] * num_assessed + [1.0]
+            info[TOTAL_SPECTRAL_SIMILARITY] += [None] * num_assessed + [0]
+            info[STEP_INDICES] = list(self.step_indices_store.get_sample(i))
+            graph_wrappers.append(graph_wrapper)
+        assess_trajectories(graph_wrappers)
+        #
+        return [graph_wrapper.perturbed_spectra_info for graph_wrapper in graph_wrappers]
+
+    def record_sample(self, i, perturbed_spectra_info):
+        #
+        self.record_samples(i, [perturbed_spectra_info])
+        #
+        return
+
+    def record_samples(self, first_sample, perturbed_spectra_infos):
+        '''
+        Records the samples first_sample, first_sample + 1, ... in bulk;
+        they must follow the samples recorded so far. Once all their data
+        is written, the checkpoint file is replaced atomically, so it only
+        ever lists completely recorded samples.
+        '''
+        #
+        if not self.record:
+            raise Exception("%s is not recorded (record=False), so samples cannot be recorded." % self.graph_wrapper.name)
+        if first_sample != self.num_recorded:
+            raise Exception("Sample %s cannot be recorded after %s samples." % (first_sample, self.num_recorded))
+        start = perf_counter()
+        #
+        # Record the data in the chosen stores (appends)
+        self.rss_store.append([info[REDUCED_SPECTRAL_SIMILARITY] for info in perturbed_spectra_infos])
+        self.isd_store.append([info[IRRECONCILABLE_SPECTRAL_DIFFERENCE] for info in perturbed_spectra_infos])
+        self.tss_store.append([info[TOTAL_SPECTRAL_SIMILARITY] for info in perturbed_spectra_infos])
+        self.bulk_indices_store.append([info[BULK_INDICES] for info in perturbed_spectra_infos])
+        self.perturbation_orders_store.append([info[PERTURBATION_ORDER] for info in perturbed_spectra_infos])
+        self.step_indices_store.append([info[STEP_INDICES] for info in perturbed_spectra_infos])
+        self.spectra_archive.append([info[SPECTRA] for info in perturbed_spectra_infos])
+        self.normalized_eigencentralities_archive.append([info[NORMALIZED_EIGENCENTRALITIES] for info in perturbed_spectra_infos])
+        #
+        # One sample at a time, so that the statistics do not
+        # depend on how the samples were grouped
+        for info in perturbed_spectra_infos:
+            for metric, statistics in self.statistics.items():
+                statistics.add([info[metric]])
+            self.step_axis = update_step_axis(self.step_axis, info[STEP_INDICES])
+        #
+        # Checkpoint
+        self.num_recorded = first_sample + len(perturbed_spectra_infos)
+        self.save_checkpoint()
+        self.timer.record(RECORD_STAGE, 0, perf_counter() - start, len(perturbed_spectra_infos))
         #
         return
 
-    def initialize_files(self):
+    def save_checkpoint(self):
+        #
+        dump_json(self.checkpoint_file, {"num_samples": self.num_recorded, "seed": self.seed, "legacy_samples": self.legacy_samples,
+                                         "spectra_dtype": self.spectra_dtype.str, "stride": self.stride, "fractions": self.fractions})
+        #
+        return
+
+    def restore_checkpoint(self):
+        '''
+        Returns the number of samples recorded in data_dir according to the
+        checkpoint file, after cutting the stores back to them (a crash may
+        leave extra or half-written samples). Data without a checkpoint is
+        adopted (see trajectory_store_def.adopt_legacy_dir); an empty
+        data_dir gets a checkpoint of no samples, so that data without one
+        is always legacy data. Data recorded with another seed,
+        spectra_dtype, stride or fractions raises an exception.
+        '''
+        #
+        checkpoint = adopt_legacy_dir(self.data_dir)
+        if checkpoint is None:
+            self.num_recorded = 0
+            self.save_checkpoint()
+            return 0
+        #
+        check_checkpoint(checkpoint, self.data_dir, self.seed, self.spectra_dtype, self.stride, self.fractions)
+        self.legacy_samples = checkpoint.get("legacy_samples", 0)
+        #
+        # Stores that the recorded data predates hold nothing for its
+        # samples, except the step indices: they were all assessed
+        if self.rss_store.exists():
+            lengths = diff(self.rss_store.load()[1])
+            if not self.step_indices_store.exists():
+                self.step_indices_store.append([arange(length) for length in lengths])
+            for store in [self.bulk_indices_store, self.perturbation_orders_store, self.spectra_archive, self.normalized_eigencentralities_archive]:
+                if not store.exists():
+                    store.append([[] for length in lengths])
+                #
+            #
+        #
+        # A shorter store limits the samples that can be kept
+        stores = [self.rss_store, self.isd_store, self.tss_store, self.bulk_indices_store, self.perturbation_orders_store, self.step_indices_store,
+                  self.spectra_archive, self.normalized_eigencentralities_archive]
+        num_recorded = checkpoint["num_samples"]
+        for store in stores:
+            num_recorded = store.truncate(num_recorded)
+        for store in stores:
+            store.truncate(num_recorded)
+        #
+        return num_recorded
+
+    def save_summary(self):
         #
-        self.rss_file = join(self.data_dir, "rss.csv")
-        self.isd_file = join(self.data_dir, "isd.csv")
-        self.tss_file = join(self.data_dir, "tss.csv")
-        self.bulk_indices_file = join(self.data_dir, "bulk_indices.csv")
-        self.spectra_file_base = join(self.data_dir, "spectra_sample_")
-        self.normalized_eigencentralities_file_base = join(self.data_dir, "normalized_eigencentralities_sample_")
+        save_summary(self.summary_file, self.statistics, self.step_axis)
         #
-        # Remove since these file are opened with 'append' command
-        remove_file(self.rss_file)
-        remove_file(self.isd_file)
-        remove_file(self.tss_file)
-        remove_file(self.bulk_indices_file)
+        return
+
+    def save_timing(self):
+        #
+        if self.timing:
+            self.timer.save_json(join(self.data_dir, "timing.json"))
+            self.timer.save_csv(join(self.data_dir, "timing.csv"))
         #
-        # NOTE: not necessary to remove spectra/centrality files, which
-        # are opened with a 'write' command
         return
 
-    def perform(self, num_samples=None):
+    def restore_statistics(self):
+        '''
+        Returns the running statistics of the recorded samples, from the
+        summary file if it is up to date, or else by streaming through the
+        stores.
+        '''
+        #
+        statistics = load_summary(self.summary_file)
+        if statistics is not None and all(s.num_samples == self.num_recorded for s in statistics.values()):
+            return statistics
         #
-        # Perform the experiment num_samples times
-        for i in range(num_samples):
+        statistics = dict((metric, step_statistics(fill_value)) for metric, fill_value in metric_fill_values.items())
+        stores = {REDUCED_SPECTRAL_SIMILARITY: self.rss_store, IRRECONCILABLE_SPECTRAL_DIFFERENCE: self.isd_store, TOTAL_SPECTRAL_SIMILARITY: self.tss_store}
+        for i in range(self.num_recorded):
+            for metric, store in stores.items():
+                statistics[metric].add([store.get_sample(i)])
+            #
+        #
+        return statistics
+
+    def restore_step_axis(self):
+        '''
+        Returns the step axis of the recorded samples (see
+        step_statistics_def.update_step_axis), from the summary file if it
+        is up to date, or else by streaming through the step index store.
+        '''
+        #
+        step_axis = load_step_axis(self.summary_file, self.num_recorded)
+        if step_axis is not None:
+            return step_axis
+        #
+        step_axis = zeros(0, dtype=int64)
+        for i in range(self.num_recorded):
+            step_axis = update_step_axis(step_axis, self.step_indices_store.get_sample(i))
+        #
+        return step_axis
+
+    def run_samples(self, num_samples=None, batch_size=1, first_sample=0):
+        '''
+        Generates the perturbed_spectra_info of samples first_sample, ...,
+        first_sample + num_samples - 1 without recording them. With
+        batch_size > 1, samples are run batch_size at a time in lockstep,
+        with one batched eigensolve per step (see
+        graph_wrapper_def.apply_perturbation_sequences). This pays off for
+        small graphs, where the per-call overhead dominates.
+        '''
+        #
+        stop = first_sample + num_samples
+        for start in range(first_sample, stop, batch_size):
+            sample_indices = range(start, min(start + batch_size, stop))
+            streams = [self.get_sample_streams(i) for i in sample_indices]
+            graph_wrappers = [self.get_sample_graph_wrapper(graph_seed) for graph_seed, rng in streams]
+            rngs = [rng for graph_seed, rng in streams]
             #
             # Apply the chosen perturbation until the graph becomes degenerate
-            self.graph_wrapper = self.graph_generator(**self.kwargs)
-            self.graph_wrapper.apply_perturbation_sequence(perturbation_type=self.perturbation_type)
+            if len(graph_wrappers) == 1:
+                graph_wrappers[0].apply_perturbation_sequence(perturbation_type=self.perturbation_type, rng=rngs[0], stride=self.stride, fractions=self.fractions)
+            else:
+                apply_perturbation_sequences(graph_wrappers, perturbation_type=self.perturbation_type, rngs=rngs, stride=self.stride, fractions=self.fractions)
             #
-            # Record the data in the chosen files (appends)
-            dump_one_d_data(self.rss_file, self.graph_wrapper.perturbed_spectra_info[REDUCED_SPECTRAL_SIMILARITY])
-            dump_one_d_data(self.isd_file, self.graph_wrapper.perturbed_spectra_info[IRRECONCILABLE_SPECTRAL_DIFFERENCE])
-            dump_one_d_data(self.tss_file, self.graph_wrapper.perturbed_spectra_info[TOTAL_SPECTRAL_SIMILARITY])
+            self.graph_wrapper = graph_wrappers[-1]
+            for graph_wrapper in graph_wrappers:
+                yield graph_wrapper.perturbed_spectra_info
             #
-            # (writes)
-            dump_two_d_data(
-                self.spectra_file_base + f'{i}.csv',
-                self.graph_wrapper.perturbed_spectra_info[SPECTRA]
-            )
-            dump_two_d_data(
-                self.normalized_eigencentralities_file_base + f'{i}.csv',
-                self.graph_wrapper.perturbed_spectra_info[NORMALIZED_EIGENCENTRALITIES]
-            )
         #
         return
 #
+
+
+def check_checkpoint(checkpoint, data_dir, seed=None, spectra_dtype=float64, stride=1, fractions=None):
+    '''
+    Raises an exception if the checkpoint of data_dir was recorded with
+    another seed (default: the seeds in seeds.csv), spectra_dtype, stride
+    or fractions than given (see experiment), so that its samples cannot
+    be extended.
+    '''
+    #
+    # Legacy samples have no known seed or spectra, so any will do
+    settings = {"seed": read_rand_seeds(seeds_file) if seed is None else seed, "spectra_dtype": npdtype(spectra_dtype).str,
+                "stride": stride, "fractions": None if fractions is None else [float(f) for f in fractions]}
+    for name, value in settings.items():
+        recorded = checkpoint.get(name, 1 if name == "stride" else None)
+        if recorded != value and not (recorded is None and name in ["seed", "spectra_dtype"]):
+            raise Exception("%s was recorded with %s %s, not %s. Use overwrite=True to replace it." % (data_dir, name, recorded, value))
+        #
+    #
+    return
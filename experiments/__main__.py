@@ -0,0 +1,64 @@
+'''
+Runs the sweeps of a sweep spec (see sweep_utils.expand_sweep_spec), e.g.
+
+    python -m experiments experiments/specs/all_families.json --dry-run
+
+from the main folder. With --dry-run, the experiments are listed with
+their estimated cost, and nothing is run.
+'''
+#
+#
+if __name__ == "__main__":
+    #
+    # Get utility libs
+    import sys
+    import os
+    import argparse
+    #
+    # Add main folder to path dynamically
+    x = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.append(x)
+    #
+    from sweep_utils import read_sweep_spec, expand_sweep_spec, estimate_sweep_cost, schedule_sweep_tasks, get_makespan, perform_sweep_jobs
+    from multiprocessing import cpu_count
+    #
+    # Ignore matplotlib and numpy warnings
+    import warnings
+    warnings.filterwarnings("ignore")
+    #
+    # Read the spec
+    parser = argparse.ArgumentParser(prog="python -m experiments", description="Runs the sweeps of a sweep spec.")
+    parser.add_argument("spec_file", help="json sweep spec")
+    parser.add_argument("--dry-run", action="store_true", help="list the experiments and their estimated cost, without running anything")
+    args = parser.parse_args()
+    spec = read_sweep_spec(args.spec_file)
+    jobs = expand_sweep_spec(spec)
+    samples_per_task = spec.get("samples_per_task", 10)
+    num_processes = spec.get("num_processes")
+    batch_size = spec.get("batch_size", 1)
+    #
+    if args.dry_run:
+        #
+        # Tasks of the missing samples only, scheduled as perform_sweep
+        # does; jobs that would fail to set up get none
+        costs = estimate_sweep_cost(jobs)
+        num_cores = cpu_count() if num_processes is None else num_processes
+        first_samples = [c.num_recorded if c.error is None else c.job.num_samples for c in costs]
+        tasks, total_seconds = schedule_sweep_tasks([c.job.experiment_kwargs for c in costs], [c.job.num_samples for c in costs], first_samples,
+                                                    [c.sample_seconds for c in costs], samples_per_task, batch_size, num_cores)
+        for cost, first_sample in zip(costs, first_samples):
+            print(f"{cost.job.graph_spec.graph_family:>20} {cost.job.experiment_kwargs['perturbation_type']:>5} {cost.job.graph_spec.name:>16}: "
+                  f"{cost.job.num_samples - first_sample:>5} of {cost.job.num_samples} samples to run, {cost.num_steps} steps each, ~{cost.seconds:.1f}s")
+            if cost.error is not None:
+                print(f"{'':>20} FAILS TO SET UP: {cost.error}")
+            #
+        #
+        makespan = get_makespan([task.seconds for task in tasks], num_cores)
+        print(f"{len(jobs)} experiments, {sum(c.job.num_samples - f for c, f in zip(costs, first_samples))} samples to run in {len(tasks)} tasks")
+        print(f"Estimated cost: ~{total_seconds:.0f} core seconds, ~{makespan:.0f}s on {num_cores} processes")
+    else:
+        failures = perform_sweep_jobs(jobs, samples_per_task, num_processes, batch_size)
+        for failure in failures:
+            print(f"FAILED: {failure.experiment_kwargs}, samples {failure.start}-{failure.stop - 1}")
+        #
+    #
@@ -10,7 +10,7 @@ if __name__ == "__main__":
     x = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sys.path.append(x)
     #
-    from experiment_def import experiment
+    from sweep_utils import perform_sweep
     from constants import COMPLETE, NODE, EDGE
     #
     # Ignore matplotlib and numpy warnings
@@ -22,21 +22,19 @@ if __name__ == "__main__":
     node_list = [5, 10, 20, 50, 100]
     num_samples = 100
     #
-    # Iterate over options
+    # Collect every configuration
+    experiment_kwargs_list = []
     for p in perturbation_types:
         for n in node_list:
-            args_dict = {
+            experiment_kwargs_list.append({
                 "num_nodes": n,
                 "perturbation_type": p,
                 "graph_family": COMPLETE
-            }
-            #
-            # Define experiment
-            print(f"Kicking off {num_samples} experiments of {p} perturbations on n={n}...")
-            try:
-                exp = experiment(**args_dict)
-                exp.perform(num_samples)
-            except:
-                print("...FAILED.")
+            })
         #
     #
+    # Fan the samples out over every core
+    print(f"Kicking off {num_samples} samples of each of {len(experiment_kwargs_list)} experiments")
+    failures = perform_sweep(experiment_kwargs_list, num_samples)
+    for failure in failures:
+        print(f"FAILED: {failure.experiment_kwargs}, samples {failure.start}-{failure.stop - 1}")
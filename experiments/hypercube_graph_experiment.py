@@ -15,7 +15,7 @@ if __name__ == "__main__":
     x = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sys.path.append(x)
     #
-    from experiment_def import experiment
+    from sweep_utils import perform_sweep
     from constants import HYPER_CUBE, NODE, EDGE
     #
     # Ignore matplotlib and numpy warnings
@@ -29,21 +29,19 @@ if __name__ == "__main__":
     ]
     num_samples = 100
     #
-    # Iterate over options
+    # Collect every configuration
+    experiment_kwargs_list = []
     for p in perturbation_types:
         for c in cube_degree_list:
-            args_dict = {
+            experiment_kwargs_list.append({
                 "cube_degree": c,
                 "perturbation_type": p,
                 "graph_family": HYPER_CUBE
-            }
-            #
-            # Define experiment
-            print(f"Kicking off {num_samples} experiments of {p} perturbations on n={c}")
-            try:
-                exp = experiment(**args_dict)
-                exp.perform(num_samples)
-            except:
-                print("...FAILED.")
+            })
         #
     #
+    # Fan the samples out over every core
+    print(f"Kicking off {num_samples} samples of each of {len(experiment_kwargs_list)} experiments")
+    failures = perform_sweep(experiment_kwargs_list, num_samples)
+    for failure in failures:
+        print(f"FAILED: {failure.experiment_kwargs}, samples {failure.start}-{failure.stop - 1}")
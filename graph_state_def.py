@@ -0,0 +1,170 @@
+import networkx as nx
+from itertools import chain
+from numpy import asarray, diag, flatnonzero, ix_, ones, zeros, arange, cumsum, fromiter, repeat
+from numpy import float64 as npfloat64
+from scipy.sparse import csr_matrix
+
+
+class graph_state(object):
+    '''
+    Array-backed graph that supports removing edges and nodes in O(deg)
+    time. Node i is row i of the Laplacian; removed and isolated nodes
+    keep their (zeroed) rows and are flagged inactive. The graph itself
+    lives in the neighbour sets and degrees; the dense Laplacian is only
+    built when first asked for (by a dense solve or a spectral engine,
+    which then read it in place) and kept up to date from then on. The
+    networkx graph is only rebuilt on request, e.g. for visualization.
+    '''
+
+    def __init__(self, graph=None):
+        #
+        # Empty states are filled in by copy
+        if graph is None:
+            return
+        #
+        self.labels = list(graph.nodes())
+        self.index = dict(zip(self.labels, range(len(self.labels))))
+        self.dense_laplacian = None
+        self.degrees = asarray([graph.degree(n) for n in self.labels], dtype=npfloat64)
+        self.active = self.degrees > 0
+        self.num_active = int(self.active.sum())
+        self.num_edges = graph.number_of_edges()
+        self.neighbors = [set(self.index[m] for m in graph.neighbors(n)) for n in self.labels]
+        self.edges = [(self.index[u], self.index[v]) for u, v in graph.edges()]
+        self.graph = None
+        #
+        return
+
+    def copy(self):
+        #
+        state = graph_state()
+        state.labels = self.labels
+        state.index = self.index
+        state.dense_laplacian = None if self.dense_laplacian is None else self.dense_laplacian.copy()
+        state.degrees = self.degrees.copy()
+        state.active = self.active.copy()
+        state.num_active = self.num_active
+        state.num_edges = self.num_edges
+        state.neighbors = [set(n) for n in self.neighbors]
+        state.edges = self.edges
+        state.graph = None
+        #
+        return state
+
+    def deactivate_isolated(self, nodes):
+        #
+        for node in nodes:
+            if self.active[node] and self.degrees[node] == 0:
+                self.active[node] = False
+                self.num_active -= 1
+            #
+        #
+        return
+
+    def get_adjacency(self):
+        #
+        nodes = self.get_nodes()
+        #
+        return self.get_sparse_adjacency(nodes).toarray()
+
+    def get_sparse_adjacency(self, nodes=None):
+        '''
+        Returns the adjacency matrix among nodes (default: the active
+        nodes, which hold all edges) as a csr_matrix with sorted indices,
+        built from the neighbour sets in O(edges).
+        '''
+        #
+        nodes = self.get_nodes() if nodes is None else nodes
+        positions = zeros(len(self.labels), dtype=int)
+        positions[nodes] = arange(nodes.shape[0])
+        counts = [len(self.neighbors[n]) for n in nodes]
+        indptr = zeros(nodes.shape[0] + 1, dtype=int)
+        indptr[1:] = cumsum(counts)
+        columns = fromiter(chain.from_iterable(self.neighbors[n] for n in nodes), dtype=int, count=indptr[-1])
+        #
+        adjacency = csr_matrix((ones(columns.shape[0]), positions[columns], indptr), shape=(nodes.shape[0], nodes.shape[0]))
+        adjacency.sort_indices()
+        #
+        return adjacency
+
+    def get_graph(self):
+        #
+        # Rebuilt lazily after every removal
+        if self.graph is None:
+            nodes = self.get_nodes()
+            self.graph = nx.Graph()
+            self.graph.add_nodes_from(self.labels[n] for n in nodes)
+            self.graph.add_edges_from((self.labels[n], self.labels[m]) for n in nodes for m in self.neighbors[n] if n < m)
+        #
+        return self.graph
+
+    def get_laplacian(self):
+        #
+        nodes = self.get_nodes()
+        #
+        return self.laplacian[ix_(nodes, nodes)]
+
+    @property
+    def laplacian(self):
+        #
+        # Built from the current neighbour sets on first use
+        if self.dense_laplacian is None:
+            counts = [len(neighbors) for neighbors in self.neighbors]
+            rows = repeat(arange(len(self.labels)), counts)
+            columns = fromiter(chain.from_iterable(self.neighbors), dtype=int, count=rows.shape[0])
+            self.dense_laplacian = diag(self.degrees)
+            self.dense_laplacian[rows, columns] = -1.0
+        #
+        return self.dense_laplacian
+
+    def get_nodes(self):
+        #
+        return flatnonzero(self.active)
+
+    def is_degenerate(self):
+        return self.num_active < 2
+
+    def remove_edge(self, u, v):
+        #
+        if self.dense_laplacian is not None:
+            self.dense_laplacian[u, v] = 0.0
+            self.dense_laplacian[v, u] = 0.0
+            self.dense_laplacian[u, u] -= 1.0
+            self.dense_laplacian[v, v] -= 1.0
+        self.degrees[u] -= 1.0
+        self.degrees[v] -= 1.0
+        self.neighbors[u].discard(v)
+        self.neighbors[v].discard(u)
+        self.num_edges -= 1
+        self.graph = None
+        #
+        # Remove isolated nodes
+        self.deactivate_isolated((u, v))
+        #
+        return
+
+    def remove_node(self, node):
+        '''
+        Returns the (former) neighbours of node, which is what incremental
+        engines need to follow the removal.
+        '''
+        #
+        neighbors = asarray(sorted(self.neighbors[node]), dtype=int)
+        if self.dense_laplacian is not None:
+            self.dense_laplacian[node, neighbors] = 0.0
+            self.dense_laplacian[neighbors, node] = 0.0
+            self.dense_laplacian[neighbors, neighbors] -= 1.0
+            self.dense_laplacian[node, node] = 0.0
+        self.degrees[neighbors] -= 1.0
+        self.degrees[node] = 0.0
+        for neighbor in neighbors:
+            self.neighbors[neighbor].discard(node)
+        self.neighbors[node] = set()
+        self.num_edges -= neighbors.shape[0]
+        self.graph = None
+        #
+        # Remove the node and any neighbours left isolated
+        self.deactivate_isolated([node])
+        self.deactivate_isolated(neighbors)
+        #
+        return neighbors
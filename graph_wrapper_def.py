@@ -1,15 +1,27 @@
 import networkx as nx
-import matplotlib.pyplot as plt
-from numpy.random import choice
-from numpy.linalg import norm
-from numpy import asarray, sum, log2, ones
+from numpy.random import permutation
+from numpy.linalg import norm, eigh, eigvals, eigvalsh
+from numpy import asarray, sum, log2, ones, sort, abs, zeros, arange, rint, unique, concatenate
 from numpy import float64 as npfloat64
 from constants import graph_dict, layout_dict, LAPLACIAN, ADJACENCY, NODE, EDGE,\
     TARGET, PERTURBED, SPRING, KAWADA, FRUCHTERMAN, BULK_INDICES,\
     NORMALIZED_EIGENCENTRALITIES, SPECTRA, REDUCED_SPECTRAL_SIMILARITY,\
-    IRRECONCILABLE_SPECTRAL_DIFFERENCE, TOTAL_SPECTRAL_SIMILARITY
+    IRRECONCILABLE_SPECTRAL_DIFFERENCE, TOTAL_SPECTRAL_SIMILARITY, DENSE,\
+    deterministic_graph_families, CLOSED_FORM, NUMERIC, VALIDATE, PERTURBATION_ORDER,\
+    PERTURB_STAGE, SPECTRUM_STAGE, CENTRALITY_STAGE, METRICS_STAGE, STEP_INDICES
+from spectral_engines import spectral_engine_dict
+from centrality_engines import centrality_engine_dict, get_leading_eigenvector, max_dense_centrality_nodes
+from graph_state_def import graph_state
+from closed_form_spectra import get_closed_form_spectrum, get_closed_form_eigencentrality
+from stage_timer_def import null_timer
+from spectral_metrics import pad_spectra, get_trajectory_metrics
 from utils import get_subplot_indices
-from scipy.stats import moment
+from time import perf_counter
+
+#
+# Layouts of deterministic graphs, keyed by
+# (family, args, kwargs, layout)
+layout_cache = {}
 
 
 class graph_wrapper(object):
@@ -22,17 +34,24 @@ class graph_wrapper(object):
                  name="G",
                  expected_nodes=None,
                  expected_edges=None,
+                 spectral_engine=DENSE,
+                 centrality_engine=DENSE,
+                 target_spectrum=CLOSED_FORM,
                  ):
         #
         # Create graph data structure
         self.graph = graph_dict[graph_family](*args, **kwargs)
+        self.graph_family = graph_family
+        self.args = args
+        self.kwargs = kwargs
         self.name = name
         self.expected_nodes = expected_nodes
         self.expected_edges = expected_edges
         #
-        # Relabel to guarantee integer labels
-        mapping = dict(zip(self.graph.nodes(), list(range(len(self.graph.nodes())))))
-        self.graph = nx.relabel_nodes(self.graph, mapping)
+        # Relabel to guarantee integer labels (most generators have them)
+        if list(self.graph.nodes()) != list(range(self.graph.number_of_nodes())):
+            mapping = dict(zip(self.graph.nodes(), list(range(len(self.graph.nodes())))))
+            self.graph = nx.relabel_nodes(self.graph, mapping)
         #
         # Remove isolated nodes
         nodes_for_iteration = list(self.graph.nodes())
@@ -40,7 +59,10 @@ class graph_wrapper(object):
             if nx.degree(self.graph, n) == 0:
                 self.graph.remove_node(n)
         #
-        # Set default layout
+        # Array-backed copy from which perturbed states are made
+        self.target_state = graph_state(self.graph)
+        #
+        # Set default layout (computed when first drawn)
         self.set_layout(layout)
         #
         # Establish visualization bounds for Laplacian matrix
@@ -49,11 +71,19 @@ class graph_wrapper(object):
         self.min_cmap_val = -1
         #
         # Init spectra
+        if target_spectrum not in [CLOSED_FORM, NUMERIC, VALIDATE]:
+            raise Exception("Invalid target spectrum, %s, specified. Must be one of %s." % (target_spectrum, [CLOSED_FORM, NUMERIC, VALIDATE]))
+        self.target_spectrum_mode = target_spectrum
         self.target_spectrum = self.get_spectrum(graph_choice=TARGET, matrix=LAPLACIAN)
         self.target_bulk_index = self.get_bulk_index(self.target_spectrum)
         self.target_eigencentrality = self.get_normalized_eigencentrality(graph_choice=TARGET)
         self.target_spectrum_norm = norm(self.target_spectrum)
         #
+        # Set the engine that tracks the perturbed spectrum
+        self.set_spectral_engine(spectral_engine)
+        self.set_centrality_engine(centrality_engine)
+        self.set_timer()
+        #
         # Init perturbed graph
         self.init_perturbed_graph()
         #
@@ -62,7 +92,7 @@ class graph_wrapper(object):
     def apply_perturbation(self, perturbation_type=NODE):
         #
         # Don't perturb degenerate graphs
-        if self.is_degenerate(self.perturbed_graph):
+        if self.perturbed_state.is_degenerate():
             print("Cannot perturb a degenerate graph. Aborting!")
             return
         #
@@ -70,81 +100,110 @@ class graph_wrapper(object):
         if perturbation_type not in [NODE, EDGE]:
             raise Exception("Invalid perturbation type, %s, specified. Must be either %s or %s." % (perturbation_type, LAPLACIAN, ADJACENCY))
         #
+        # Draw the removal order on first use
+        if self.perturbation_order is None or self.perturbation_order_type != perturbation_type:
+            self.set_perturbation_order(perturbation_type)
+        #
         if perturbation_type == NODE:
             #
-            # Randomly select a node
-            node_choice = choice(self.perturbed_graph.nodes())
-            #
-            # Record neighbors
-            node_neighbors = nx.neighbors(self.perturbed_graph, node_choice)
-            #
-            # Remove selected node
-            self.perturbed_graph.remove_node(node_choice)
+            # Select the next node in the removal order
+            node_choice = self.get_next_perturbation()
             #
-            # Remove isolated nodes
-            for n in node_neighbors:
-                if nx.degree(self.perturbed_graph, n) == 0:
-                    self.perturbed_graph.remove_node(n)
+            # Remove selected node (and any isolated neighbors)
+            node_neighbors = self.perturbed_state.remove_node(node_choice)
+            if self.spectral_engine is not None:
+                self.spectral_engine.remove_node(node_choice, node_neighbors)
+            if self.centrality_engine is not None:
+                self.centrality_engine.remove_node(node_choice, node_neighbors)
             #
         elif perturbation_type == EDGE:
             #
-            # Randomly select an edge
-            edge_index_choice = choice(len(self.perturbed_edge_list))
-            edge_choice = self.perturbed_edge_list.pop(edge_index_choice)
+            # Select the next edge in the removal order
+            edge_choice = self.get_next_perturbation()
             #
-            # Remove selected edge
-            self.perturbed_graph.remove_edge(*edge_choice)
-            #
-            # Remove isolated nodes
-            for edge_node in edge_choice:
-                #
-                if self.perturbed_graph.degree(edge_node) == 0:
-                    self.perturbed_graph.remove_node(edge_node)
-                #
+            # Remove selected edge (and any isolated end points)
+            self.perturbed_state.remove_edge(*edge_choice)
+            if self.spectral_engine is not None:
+                self.spectral_engine.remove_edge(*edge_choice)
+            if self.centrality_engine is not None:
+                self.centrality_engine.remove_edge(*edge_choice)
             #
         #
+        self.num_perturbations += 1
+        #
         return
 
-    def apply_perturbation_sequence(self, perturbation_type=NODE):
+    def apply_perturbation_sequence(self, perturbation_type=NODE, order=None, rng=None, stride=1, fractions=None):
+        '''
+        Perturbs the graph until it is degenerate. Every removal is
+        applied, but the perturbed graph is only assessed at the
+        evaluation steps (see get_evaluation_steps) and once it is
+        degenerate; the removals at which it was assessed are recorded as
+        its step indices.
+        '''
         #
         # Reinitialize the perturbed graph
         self.init_perturbed_graph()
+        self.set_perturbation_order(perturbation_type, order, rng)
+        evaluation_steps = set(get_evaluation_steps(len(self.perturbation_order), stride, fractions).tolist())
         #
         # Iterate
         while not self.perturbed_graph_is_degenerate:
-            self.apply_perturbation(perturbation_type)
-            self.assess_similarity()
+            with self.timer.time(PERTURB_STAGE, len(self.perturbed_spectra_info[SPECTRA])):
+                self.apply_perturbation(perturbation_type)
+            if self.num_perturbations in evaluation_steps or self.perturbed_state.is_degenerate():
+                self.assess_similarity(assess_metrics=False)
+        #
+        # Metrics of the whole sequence in one pass
+        assess_trajectories([self])
         #
         return
 
-    def assess_similarity(self):
+    def assess_similarity(self, perturbed_spectrum=None, perturbed_normalized_eigencentrality=None, assess_metrics=True):
+        '''
+        Records the spectrum, eigencentrality and metrics of the perturbed
+        graph as the next step. With assess_metrics=False the metrics are
+        left as None, to be filled in for all steps at once by
+        assess_trajectories.
+        '''
         #
         # Make sure perturbed graph is not degenerate
-        self.perturbed_graph_is_degenerate = self.is_degenerate(self.perturbed_graph)
+        self.perturbed_graph_is_degenerate = self.perturbed_state.is_degenerate()
         if self.perturbed_graph_is_degenerate:
             perturbed_spectrum = [0]
-            perturbed_bulk_index = [0]
+            perturbed_bulk_index = 0
             perturbed_normalized_eigencentrality = [0]
             rss = 0
             isd = 1.0
             tss = 0
         else:
             #
-            # Determine the minimal index containing 90% of eigenvalue sum
-            perturbed_spectrum = self.get_spectrum(graph_choice=PERTURBED, matrix=LAPLACIAN)
-            perturbed_bulk_index = self.get_bulk_index(perturbed_spectrum)
+            # Calculate spectrum
+            step = len(self.perturbed_spectra_info[SPECTRA])
+            if perturbed_spectrum is None:
+                with self.timer.time(SPECTRUM_STAGE, step):
+                    perturbed_spectrum = self.get_spectrum(graph_choice=PERTURBED, matrix=LAPLACIAN)
             #
             # Calculate eigencentrality
-            perturbed_normalized_eigencentrality = self.get_normalized_eigencentrality(graph_choice=PERTURBED)
-            #
-            # Calculate Irreconcilable Spectral Dissimilarity
-            rss = self.get_rss(perturbed_spectrum, self.target_spectrum, perturbed_bulk_index)
+            if perturbed_normalized_eigencentrality is None:
+                with self.timer.time(CENTRALITY_STAGE, step):
+                    perturbed_normalized_eigencentrality = self.get_normalized_eigencentrality(graph_choice=PERTURBED)
             #
-            # Calculate Reduced Spectral Similarity
-            isd = self.get_isd(perturbed_spectrum, self.target_spectrum, bulk_index=perturbed_bulk_index)
-            #
-            # Calculate Total Spectral Similarity
-            tss = (1.0 - isd) * rss
+            perturbed_bulk_index, rss, isd, tss = None, None, None, None
+            if assess_metrics:
+                with self.timer.time(METRICS_STAGE, step):
+                    #
+                    # Determine the minimal index containing 90% of eigenvalue sum
+                    perturbed_bulk_index = self.get_bulk_index(perturbed_spectrum)
+                    #
+                    # Calculate Irreconcilable Spectral Dissimilarity
+                    rss = self.get_rss(perturbed_spectrum, self.target_spectrum, perturbed_bulk_index)
+                    #
+                    # Calculate Reduced Spectral Similarity
+                    isd = self.get_isd(perturbed_spectrum, self.target_spectrum, bulk_index=perturbed_bulk_index)
+                    #
+                    # Calculate Total Spectral Similarity
+                    tss = (1.0 - isd) * rss
         #
         # Update data
         self.update_perturbed_spectra_info(
@@ -173,9 +232,20 @@ class graph_wrapper(object):
         #
         return kl_div
 
+    def check_graph_choice(self, graph_choice):
+        #
+        # Make sure valid choice
+        if graph_choice not in [TARGET, PERTURBED]:
+            raise Exception("Invalid graph choice, %s, specified. Must be either %s or %s." % (graph_choice, TARGET, PERTURBED))
+        #
+        return
+
     def get_bulk_index(self, spectrum):
         spectral_sum = sum(spectrum)
-        cut_off = 0.95 * spectral_sum
+        #
+        # Integer spectra (complete, star, hyper cube, ...) can hit the cut
+        # off exactly, so ties are resolved independently of round-off
+        cut_off = 0.95 * spectral_sum * (1 + 1e-12)
         running_sum = 0
         #
         for i in range(spectrum.shape[0]):
@@ -203,25 +273,62 @@ class graph_wrapper(object):
 
     def get_matrix(self, graph_choice=TARGET, matrix=LAPLACIAN):
         #
-        graph = self.return_valid_graph_choice(graph_choice)
+        self.check_graph_choice(graph_choice)
+        #
+        # Perturbed matrices come straight from the array-backed state
+        if graph_choice == PERTURBED:
+            return self.perturbed_state.get_laplacian() if matrix == LAPLACIAN else self.perturbed_state.get_adjacency()
         #
         if matrix == LAPLACIAN:
-            out_matrix = nx.laplacian_matrix(graph)
+            out_matrix = nx.laplacian_matrix(self.graph)
         else:
-            out_matrix = nx.adjacency_matrix(graph)
+            out_matrix = nx.adjacency_matrix(self.graph)
         #
         return out_matrix.toarray()
 
+    def get_next_perturbation(self):
+        #
+        # Skip nodes/edges that already went with an earlier removal
+        while self.next_perturbation < self.perturbation_order.shape[0]:
+            item = self.perturbation_order[self.next_perturbation]
+            self.next_perturbation += 1
+            if self.perturbation_order_type == NODE:
+                if self.perturbed_state.active[item]:
+                    return item
+                #
+            else:
+                u, v = self.target_state.edges[item]
+                if v in self.perturbed_state.neighbors[u]:
+                    return u, v
+                #
+            #
+        #
+        raise Exception("Perturbation order exhausted after %s removals." % self.next_perturbation)
+
     def get_normalized_eigencentrality(self, graph_choice=TARGET):
         #
-        G = self.return_valid_graph_choice(graph_choice)
+        self.check_graph_choice(graph_choice)
+        state = self.target_state if graph_choice == TARGET else self.perturbed_state
         #
-        if G.number_of_edges() < 2:
-            centralities = [0.5, 0.5]
-        else:
-            centralities = nx.eigenvector_centrality_numpy(G).values()
+        # Built-in targets have a closed form
+        if graph_choice == TARGET and self.target_spectrum_mode != NUMERIC:
+            e = get_closed_form_eigencentrality(self.graph_family, self.args, self.kwargs)
+            if e is not None:
+                if self.target_spectrum_mode == VALIDATE:
+                    self.validate_eigencentrality(e)
+                return e
+            #
         #
-        e = asarray(list(centralities))
+        if state.num_edges < 2:
+            e = asarray([0.5, 0.5])
+        elif graph_choice == PERTURBED and self.centrality_engine is not None:
+            #
+            # Already normalized and ordered like the perturbed graph's nodes
+            return self.centrality_engine.get_centrality()
+        else:
+            #
+            # Leading adjacency eigenvector
+            e = get_leading_eigenvector(state.get_sparse_adjacency())
         #
         return e / sum(e)
 
@@ -250,22 +357,41 @@ class graph_wrapper(object):
 
     def get_spectrum(self, graph_choice=TARGET, matrix=LAPLACIAN):
         #
-        graph = self.return_valid_graph_choice(graph_choice)
+        self.check_graph_choice(graph_choice)
+        #
+        # Incrementally tracked spectra are already sorted
+        if graph_choice == PERTURBED and matrix == LAPLACIAN and self.spectral_engine is not None:
+            return self.spectral_engine.get_spectrum()
+        #
+        # Built-in families have closed-form target spectra
+        if graph_choice == TARGET and matrix == LAPLACIAN and self.target_spectrum_mode != NUMERIC:
+            spectrum = get_closed_form_spectrum(self.graph_family, self.args, self.kwargs)
+            if spectrum is not None:
+                if self.target_spectrum_mode == VALIDATE:
+                    self.validate_spectrum(spectrum)
+                return spectrum
+            #
         #
         if matrix == LAPLACIAN:
-            spectrum = nx.laplacian_spectrum(graph)
+            spectrum = eigvalsh(self.get_matrix(graph_choice=graph_choice, matrix=LAPLACIAN))
         else:
-            spectrum = nx.adjacency_spectrum(graph)
+            spectrum = eigvals(self.get_matrix(graph_choice=graph_choice, matrix=ADJACENCY))
         #
-        return asarray(sorted(spectrum, reverse=True))
+        return sort(spectrum)[::-1]
 
 #     def get_third_moment
 
     def init_perturbed_graph(self):
         #
-        self.perturbed_graph = self.graph.copy()
+        self.perturbed_state = self.target_state.copy()
         self.perturbed_graph_is_degenerate = False
-        self.perturbed_edge_list = list(self.perturbed_graph.edges())
+        self.num_perturbations = 0
+        self.perturbation_order = None
+        self.perturbation_order_type = None
+        if self.spectral_engine is not None:
+            self.spectral_engine.reset(self.perturbed_state)
+        if self.centrality_engine is not None:
+            self.centrality_engine.reset(self.perturbed_state)
         rss = self.get_rss(self.target_spectrum, self.target_spectrum, self.target_bulk_index)
         isd = self.get_isd(self.target_spectrum, self.target_spectrum)
         tss = (1 - isd) * rss
@@ -288,6 +414,10 @@ class graph_wrapper(object):
             TOTAL_SPECTRAL_SIMILARITY: [
                 tss
             ],
+            PERTURBATION_ORDER: None,
+            STEP_INDICES: [
+                0
+            ],
         }
         #
         return
@@ -295,17 +425,102 @@ class graph_wrapper(object):
     def is_degenerate(self, graph):
         return len(list(graph.nodes())) < 2
 
+    @property
+    def perturbed_graph(self):
+        #
+        # Only built on demand, e.g. for visualization
+        return self.perturbed_state.get_graph()
+
+    @property
+    def pos(self):
+        #
+        # Layouts are expensive, so they are only computed when a graph is
+        # drawn and are shared between wrappers of the same deterministic graph
+        if self.layout_positions is None:
+            key = (self.graph_family, tuple(self.args), tuple(sorted(self.kwargs.items())), self.layout)
+            if key in layout_cache:
+                self.layout_positions = layout_cache[key]
+            else:
+                self.layout_positions = layout_dict[self.layout](self.graph)
+                if self.graph_family in deterministic_graph_families:
+                    layout_cache[key] = self.layout_positions
+                #
+            #
+        #
+        return self.layout_positions
+
     def return_valid_graph_choice(self, graph_choice):
         #
-        # Make sure valid choice
-        if graph_choice not in [TARGET, PERTURBED]:
-            raise Exception("Invalid graph choice, %s, specified. Must be either %s or %s." % (graph_choice, TARGET, PERTURBED))
+        self.check_graph_choice(graph_choice)
         #
         return self.graph if graph_choice == TARGET else self.perturbed_graph
 
+    def set_centrality_engine(self, centrality_engine=DENSE, **kwargs):
+        #
+        # Make sure valid choice
+        if centrality_engine != DENSE and centrality_engine not in centrality_engine_dict:
+            raise Exception("Invalid centrality engine, %s, specified. Must be one of %s." % (centrality_engine, [DENSE] + list(centrality_engine_dict)))
+        #
+        # Like spectral engines, these are (re)started by init_perturbed_graph
+        self.centrality_engine = None if centrality_engine == DENSE else centrality_engine_dict[centrality_engine](**kwargs)
+        #
+        return
+
+    def set_perturbation_order(self, perturbation_type=NODE, order=None, rng=None):
+        '''
+        Nodes are removed in order of their rows in the Laplacian (rows of
+        target_state) and edges in order of their index in
+        target_state.edges. Without an order, a random permutation is drawn
+        up front from rng (a numpy Generator; default: numpy's global
+        state). Either way it is recorded with the results, so that a
+        sequence can be replayed.
+        '''
+        #
+        # Make sure valid choice
+        if perturbation_type not in [NODE, EDGE]:
+            raise Exception("Invalid perturbation type, %s, specified. Must be either %s or %s." % (perturbation_type, NODE, EDGE))
+        #
+        if order is None:
+            num_items = len(self.target_state.labels) if perturbation_type == NODE else len(self.target_state.edges)
+            order = permutation(num_items) if rng is None else rng.permutation(num_items)
+        #
+        self.perturbation_order = asarray(order, dtype=int)
+        self.perturbation_order_type = perturbation_type
+        self.next_perturbation = 0
+        self.perturbed_spectra_info[PERTURBATION_ORDER] = self.perturbation_order
+        #
+        return
+
+    def set_spectral_engine(self, spectral_engine=DENSE, **kwargs):
+        #
+        # Make sure valid choice
+        if spectral_engine != DENSE and spectral_engine not in spectral_engine_dict:
+            raise Exception("Invalid spectral engine, %s, specified. Must be one of %s." % (spectral_engine, [DENSE] + list(spectral_engine_dict)))
+        #
+        # The dense engine solves every perturbed graph from scratch. Other
+        # engines are (re)started from the target by init_perturbed_graph
+        self.spectral_engine = None if spectral_engine == DENSE else spectral_engine_dict[spectral_engine](**kwargs)
+        #
+        return
+
+    def set_timer(self, timer=None):
+        '''
+        Times the stages of the perturbation sequences with timer (see
+        stage_timer_def). Without a timer, nothing is timed.
+        '''
+        #
+        self.timer = null_timer() if timer is None else timer
+        #
+        return
+
     def set_layout(self, layout):
         #
-        self.pos = layout_dict[layout](self.graph)
+        # Make sure valid choice
+        if layout not in layout_dict:
+            raise Exception("Invalid layout, %s, specified. Must be one of %s." % (layout, list(layout_dict)))
+        #
+        self.layout = layout
+        self.layout_positions = None
         #
         return
 
@@ -324,6 +539,30 @@ class graph_wrapper(object):
         self.perturbed_spectra_info[REDUCED_SPECTRAL_SIMILARITY].append(rss)
         self.perturbed_spectra_info[IRRECONCILABLE_SPECTRAL_DIFFERENCE].append(isd)
         self.perturbed_spectra_info[TOTAL_SPECTRAL_SIMILARITY].append(tss)
+        self.perturbed_spectra_info[STEP_INDICES].append(self.num_perturbations)
+        #
+        return
+
+    def validate_spectrum(self, spectrum, tolerance=1e-8):
+        #
+        # Compare a closed-form target spectrum against the numeric solver
+        numeric_spectrum = sort(eigvalsh(self.get_matrix(graph_choice=TARGET, matrix=LAPLACIAN)))[::-1]
+        if numeric_spectrum.shape != spectrum.shape:
+            raise Exception("Closed-form spectrum of %s has %s eigenvalues, numeric one has %s." % (self.name, spectrum.shape[0], numeric_spectrum.shape[0]))
+        #
+        error = abs(numeric_spectrum - spectrum).max() if spectrum.shape[0] > 0 else 0.0
+        if error > tolerance * max(1.0, abs(spectrum).max()):
+            raise Exception("Closed-form spectrum of %s is off by %s from the numeric one." % (self.name, error))
+        #
+        return
+
+    def validate_eigencentrality(self, eigencentrality, tolerance=1e-8):
+        #
+        # Compare a closed-form target eigencentrality against the numeric solver
+        e = get_leading_eigenvector(self.target_state.get_sparse_adjacency())
+        error = abs(e / sum(e) - eigencentrality).max()
+        if error > tolerance * abs(eigencentrality).max():
+            raise Exception("Closed-form eigencentrality of %s is off by %s from the numeric one." % (self.name, error))
         #
         return
 
@@ -344,6 +583,9 @@ class graph_wrapper(object):
                   include_graph=True,
                   ):
         #
+        # Only drawing needs matplotlib
+        import matplotlib.pyplot as plt
+        #
         # Include perturbed in the titles?
         graph_title_prefix = "Perturbed " if graph_choice == PERTURBED else ""
         #
@@ -410,3 +652,166 @@ class graph_wrapper(object):
         #
         return
 #
+
+
+def stack_padded(matrices):
+    '''
+    Stacks square matrices of different sizes into one (S, n, n) array.
+    Smaller matrices are padded with a -1 diagonal, which decouples from
+    the matrix and adds eigenvalues (-1) below those of any Laplacian, and
+    below the leading eigenvalue of any adjacency matrix with an edge.
+    '''
+    #
+    sizes = [m.shape[0] for m in matrices]
+    n = max(sizes)
+    stack = zeros((len(matrices), n, n))
+    stack[:, arange(n), arange(n)] = -1.0
+    for k, m in enumerate(matrices):
+        stack[k, :sizes[k], :sizes[k]] = m
+    #
+    return stack, sizes
+
+
+def get_evaluation_steps(num_items, stride=1, fractions=None):
+    '''
+    Returns the numbers of removals (out of num_items nodes or edges) after
+    which a perturbation sequence is assessed: every stride-th, or, given
+    fractions (e.g. linspace(0, 1, 101)), the nearest to each of those
+    fractions of num_items. The target (0 removals) is always included.
+    '''
+    #
+    if stride < 1:
+        raise Exception("Invalid stride, %s, specified. Must be at least 1." % stride)
+    if fractions is None:
+        steps = arange(0, num_items + 1, stride)
+    else:
+        steps = rint(asarray(fractions, dtype=float) * num_items).astype(int).clip(0, num_items)
+    #
+    return unique(concatenate([[0], steps]))
+
+
+def apply_perturbation_sequences(graph_wrappers, perturbation_type=NODE, rngs=None, stride=1, fractions=None):
+    '''
+    Runs the perturbation sequences of several graph wrappers (samples) in
+    lockstep. At every step the perturbed Laplacians of all samples still
+    running are stacked into one (S, n, n) array and solved with a single
+    batched eigvalsh, and likewise their adjacency matrices for the
+    eigencentralities. This saves most of the per-call overhead on small
+    graphs. Spectral engines are bypassed; centrality engines still apply.
+    The removal order of each sample is drawn from its entry in rngs, if
+    given (see graph_wrapper.set_perturbation_order). Samples are only
+    assessed at their evaluation steps, as in
+    graph_wrapper.apply_perturbation_sequence.
+    '''
+    #
+    # Reinitialize the perturbed graphs
+    if rngs is None:
+        rngs = [None] * len(graph_wrappers)
+    evaluation_steps = {}
+    for graph_wrapper, rng in zip(graph_wrappers, rngs):
+        graph_wrapper.init_perturbed_graph()
+        graph_wrapper.set_perturbation_order(perturbation_type, rng=rng)
+        evaluation_steps[id(graph_wrapper)] = set(get_evaluation_steps(len(graph_wrapper.perturbation_order), stride, fractions).tolist())
+    #
+    running = list(graph_wrappers)
+    while len(running) > 0:
+        #
+        for graph_wrapper in running:
+            with graph_wrapper.timer.time(PERTURB_STAGE, len(graph_wrapper.perturbed_spectra_info[SPECTRA])):
+                graph_wrapper.apply_perturbation(perturbation_type)
+        #
+        # Only samples at an evaluation step (or degenerate) are assessed
+        assessed = [g for g in running if g.num_perturbations in evaluation_steps[id(g)] or g.perturbed_state.is_degenerate()]
+        #
+        # Samples lose nodes at different rates, so the padded eigenvalues
+        # are dropped from the front of each (ascending) spectrum
+        # (the time of a batched solve is shared among its samples)
+        solvable = [g for g in assessed if not g.perturbed_state.is_degenerate()]
+        spectra = {}
+        if len(solvable) > 0:
+            start = perf_counter()
+            laplacians, sizes = stack_padded([g.perturbed_state.get_laplacian() for g in solvable])
+            eigenvalues = eigvalsh(laplacians)
+            for k, graph_wrapper in enumerate(solvable):
+                spectra[id(graph_wrapper)] = eigenvalues[k, laplacians.shape[1] - sizes[k]:][::-1].copy()
+            seconds = (perf_counter() - start) / len(solvable)
+            for graph_wrapper in solvable:
+                graph_wrapper.timer.record(SPECTRUM_STAGE, len(graph_wrapper.perturbed_spectra_info[SPECTRA]), seconds)
+            #
+        #
+        # The leading eigenvector lives on the unpadded block; graphs too
+        # large for a dense solve are left to assess_similarity (which
+        # solves them sparsely)
+        central = [g for g in solvable if g.centrality_engine is None and g.perturbed_state.num_edges >= 2
+                   and g.perturbed_state.num_active <= max_dense_centrality_nodes]
+        centralities = {}
+        if len(central) > 0:
+            start = perf_counter()
+            adjacencies, sizes = stack_padded([g.perturbed_state.get_adjacency() for g in central])
+            eigenvectors = eigh(adjacencies)[1]
+            for k, graph_wrapper in enumerate(central):
+                e = eigenvectors[k, :sizes[k], -1]
+                centralities[id(graph_wrapper)] = e / sum(e)
+            seconds = (perf_counter() - start) / len(central)
+            for graph_wrapper in central:
+                graph_wrapper.timer.record(CENTRALITY_STAGE, len(graph_wrapper.perturbed_spectra_info[SPECTRA]), seconds)
+            #
+        #
+        for graph_wrapper in assessed:
+            graph_wrapper.assess_similarity(
+                perturbed_spectrum=spectra.get(id(graph_wrapper)),
+                perturbed_normalized_eigencentrality=centralities.get(id(graph_wrapper)),
+                assess_metrics=False
+            )
+        running = [g for g in running if not g.perturbed_graph_is_degenerate]
+    #
+    # Metrics of all sequences in one pass
+    assess_trajectories(graph_wrappers)
+    #
+    return
+
+
+def assess_trajectories(graph_wrappers, max_elements=2**21):
+    '''
+    Fills in the metrics (bulk index, rss, isd, tss) of every step that
+    assess_similarity left unassessed, for all graph wrappers at once:
+    their spectra are stacked into zero padded (samples x steps x n)
+    tensors and assessed by get_trajectory_metrics, a chunk of steps at a
+    time so that no tensor holds more than about max_elements values
+    (long edge sequences have tens of thousands of steps). The time
+    taken is shared among the steps.
+    '''
+    #
+    pending = [[t for t, rss in enumerate(g.perturbed_spectra_info[REDUCED_SPECTRAL_SIMILARITY]) if rss is None] for g in graph_wrappers]
+    num_steps = max([len(steps) for steps in pending] + [0])
+    if num_steps == 0:
+        return
+    #
+    start = perf_counter()
+    num_eigenvalues = max(g.target_spectrum.shape[0] for g in graph_wrappers)
+    targets = pad_spectra([g.target_spectrum for g in graph_wrappers], num_eigenvalues)[0]
+    chunk_size = max(1, max_elements // (len(graph_wrappers) * max(num_eigenvalues, 1)))
+    for first in range(0, num_steps, chunk_size):
+        chunks = [steps[first:first + chunk_size] for steps in pending]
+        spectra = zeros((len(graph_wrappers), max(len(steps) for steps in chunks), num_eigenvalues))
+        lengths = zeros(spectra.shape[:2], dtype=int)
+        for k, (graph_wrapper, steps) in enumerate(zip(graph_wrappers, chunks)):
+            spectra[k, :len(steps)], lengths[k, :len(steps)] = pad_spectra([graph_wrapper.perturbed_spectra_info[SPECTRA][t] for t in steps], num_eigenvalues)
+        bulk_indices, rss, isd, tss = get_trajectory_metrics(spectra, lengths, targets)
+        #
+        for k, (graph_wrapper, steps) in enumerate(zip(graph_wrappers, chunks)):
+            info = graph_wrapper.perturbed_spectra_info
+            for j, t in enumerate(steps):
+                info[BULK_INDICES][t] = int(bulk_indices[k, j])
+                info[REDUCED_SPECTRAL_SIMILARITY][t] = float(rss[k, j])
+                info[IRRECONCILABLE_SPECTRAL_DIFFERENCE][t] = float(isd[k, j])
+                info[TOTAL_SPECTRAL_SIMILARITY][t] = float(tss[k, j])
+            #
+        #
+    seconds = (perf_counter() - start) / len([t for steps in pending for t in steps])
+    for graph_wrapper, steps in zip(graph_wrappers, pending):
+        for t in steps:
+            graph_wrapper.timer.record(METRICS_STAGE, t, seconds)
+        #
+    #
+    return
@@ -1,112 +1,179 @@
 from graph_wrapper_def import graph_wrapper
 from constants import COMPLETE, COMPLETE_BIPARTITE, WHEEL, RANDOM_BINOMIAL,\
     HYPER_CUBE, CYCLE, PATH, STAR, SPRING, NODE, EDGE, PERTURBED, KAWADA
+from collections import namedtuple
 
+# Everything about a graph that follows from its family and parameters
+# alone (i.e. without generating it); these are the kwargs of graph_wrapper
+graph_spec = namedtuple("graph_spec", ["graph_family", "args", "kwargs", "name", "expected_nodes", "expected_edges"])
 
-def get_complete_graph(num_nodes=None):
+
+def get_complete_spec(num_nodes=None):
     #
     name = "K_{0}".format(num_nodes)
     #
-    return graph_wrapper(
+    return graph_spec(
         graph_family=COMPLETE,
         args=[num_nodes],
+        kwargs={},
         name=name,
         expected_nodes=num_nodes,
         expected_edges=(num_nodes * (num_nodes - 1) / 2),
     )
 
 
-def get_complete_bipartite_graph(num_nodes_C1=None, num_nodes_C2=None):
+def get_complete_graph(num_nodes=None):
+    #
+    return graph_wrapper(**get_complete_spec(num_nodes)._asdict())
+
+
+def get_complete_bipartite_spec(num_nodes_C1=None, num_nodes_C2=None):
     #
     name = f'K_{num_nodes_C1}_{num_nodes_C2}'
     #
-    return graph_wrapper(
+    return graph_spec(
         graph_family=COMPLETE_BIPARTITE,
         args=[num_nodes_C1, num_nodes_C2],
+        kwargs={},
         name=name,
         expected_nodes=(num_nodes_C1 + num_nodes_C2),
         expected_edges=(num_nodes_C1 * num_nodes_C2),
     )
 
 
-def get_star_graph(num_leaves=None):
+def get_complete_bipartite_graph(num_nodes_C1=None, num_nodes_C2=None):
+    #
+    return graph_wrapper(**get_complete_bipartite_spec(num_nodes_C1, num_nodes_C2)._asdict())
+
+
+def get_star_spec(num_leaves=None):
     #
     name = f'S_{num_leaves}'
     #
-    return graph_wrapper(
+    return graph_spec(
         graph_family=STAR,
         args=[num_leaves],
+        kwargs={},
         name=name,
         expected_nodes=(num_leaves + 1),
         expected_edges=num_leaves,
     )
 
 
-def get_path_graph(num_nodes=None):
+def get_star_graph(num_leaves=None):
+    #
+    return graph_wrapper(**get_star_spec(num_leaves)._asdict())
+
+
+def get_path_spec(num_nodes=None):
     #
     name = f'P_{num_nodes}'
     #
-    return graph_wrapper(
+    return graph_spec(
         graph_family=PATH,
         args=[num_nodes],
+        kwargs={},
         name=name,
         expected_nodes=num_nodes,
         expected_edges=(num_nodes - 1),
     )
 
 
-def get_cycle_graph(num_nodes=None):
+def get_path_graph(num_nodes=None):
+    #
+    return graph_wrapper(**get_path_spec(num_nodes)._asdict())
+
+
+def get_cycle_spec(num_nodes=None):
     #
     name = f'C_{num_nodes}'
     #
-    return graph_wrapper(
+    return graph_spec(
         graph_family=CYCLE,
         args=[num_nodes],
+        kwargs={},
         name=name,
         expected_nodes=num_nodes,
         expected_edges=num_nodes,
     )
 
 
-def get_hyper_cube_graph(cube_degree=None):
+def get_cycle_graph(num_nodes=None):
+    #
+    return graph_wrapper(**get_cycle_spec(num_nodes)._asdict())
+
+
+def get_hyper_cube_spec(cube_degree=None):
     #
     name = f'Q_{cube_degree}'
     #
-    return graph_wrapper(
+    return graph_spec(
         graph_family=HYPER_CUBE,
         args=[cube_degree],
+        kwargs={},
         name=name,
         expected_nodes=(2**cube_degree),
         expected_edges=(cube_degree * (2**(cube_degree - 1))),
     )
 
 
-def get_random_binomial_graph(num_nodes=None, edge_prob=None):
+def get_hyper_cube_graph(cube_degree=None):
+    #
+    return graph_wrapper(**get_hyper_cube_spec(cube_degree)._asdict())
+
+
+def get_random_binomial_spec(num_nodes=None, edge_prob=None, seed=None):
     #
     name = f'B_{num_nodes}_{edge_prob}'
     #
-    return graph_wrapper(
+    return graph_spec(
         graph_family=RANDOM_BINOMIAL,
         args=[num_nodes, edge_prob],
+        kwargs={"seed": seed},
         name=name,
         expected_nodes=(num_nodes - num_nodes * ((1 - edge_prob)**(num_nodes - 1))),
         expected_edges=(edge_prob * (num_nodes * (num_nodes - 1) / 2)),
     )
 
 
-def get_wheel_graph(num_spokes=None):
+def get_random_binomial_graph(num_nodes=None, edge_prob=None, seed=None):
+    #
+    return graph_wrapper(**get_random_binomial_spec(num_nodes, edge_prob, seed)._asdict())
+
+
+def get_wheel_spec(num_spokes=None):
     #
     name = f'W_{num_spokes}'
     #
-    return graph_wrapper(
+    return graph_spec(
         graph_family=WHEEL,
         args=[num_spokes],
+        kwargs={},
         name=name,
         expected_nodes=num_spokes,
         expected_edges=(2 * (num_spokes - 1)),
     )
 
 
+def get_wheel_graph(num_spokes=None):
+    #
+    return graph_wrapper(**get_wheel_spec(num_spokes)._asdict())
+
+
+#
+# Construct graph spec dictionary for names and
+# expected counts without generating the graph
+graph_spec_dict = {
+    "complete": get_complete_spec,
+    "complete_bipartite": get_complete_bipartite_spec,
+    "star": get_star_spec,
+    "path": get_path_spec,
+    "cycle": get_cycle_spec,
+    "hyper_cube": get_hyper_cube_spec,
+    "random_binomial": get_random_binomial_spec,
+    "wheel": get_wheel_spec
+}
+
 #
 # Construct graph wrapper dictionary
 # for easy graph generation
@@ -0,0 +1,119 @@
+from numpy import cumsum, zeros, load, savez_compressed, float64, int64
+from trajectory_store_def import trajectory_store, write_array
+from os.path import exists
+from utils import remove_file
+
+
+class spectra_archive(object):
+    #
+    #
+    def __init__(self, file_base=None, dtype=float64):
+        '''
+        Packs the per-step arrays of all samples (e.g. the perturbed spectra,
+        one per perturbation step) into one archive with two levels of
+        offsets: a trajectory_store at file_base holds all steps back to
+        back, and file_base + "_samples.npy" the index of the first step of
+        each sample, plus the end of the last. Step t of sample s is thus
+        step samples[s] + t of the store. dtype may be float32 to halve the
+        archive. Reads are memory-mapped.
+        '''
+        #
+        self.steps = trajectory_store(file_base, dtype)
+        self.samples_file = file_base + "_samples.npy"
+        self.dtype = self.steps.dtype
+        #
+        return
+
+    def append(self, samples):
+        '''
+        Appends a list of samples, each a list of 1-d arrays (one per step),
+        in bulk. The sample offsets are written last, so a crash never
+        leaves them pointing past the steps.
+        '''
+        #
+        if not self.exists():
+            self.steps.remove()
+            self.steps.append([])
+            write_array(self.samples_file, zeros(1, dtype=int64))
+        #
+        # Drop any steps left over from an interrupted append
+        sample_offsets = load(self.samples_file)
+        self.steps.truncate(sample_offsets[-1])
+        self.steps.append([step for sample in samples for step in sample])
+        write_array(self.samples_file, sample_offsets[-1] + cumsum([len(sample) for sample in samples], dtype=int64), len(sample_offsets))
+        #
+        return
+
+    def exists(self):
+        #
+        return self.steps.exists() and exists(self.samples_file)
+
+    def get(self, s, t):
+        '''
+        Returns step t of sample s, without reading anything else.
+        '''
+        #
+        values, step_offsets, sample_offsets = self.load()
+        if t < 0 or t >= sample_offsets[s + 1] - sample_offsets[s]:
+            raise Exception("Step %s out of range for sample %s with %s steps." % (t, s, sample_offsets[s + 1] - sample_offsets[s]))
+        k = sample_offsets[s] + t
+        #
+        return values[step_offsets[k]:step_offsets[k + 1]]
+
+    def get_num_samples(self):
+        #
+        if not self.exists():
+            return 0
+        #
+        return load(self.samples_file, mmap_mode='r').shape[0] - 1
+
+    def get_sample(self, s):
+        #
+        values, step_offsets, sample_offsets = self.load()
+        #
+        return [values[step_offsets[k]:step_offsets[k + 1]] for k in range(sample_offsets[s], sample_offsets[s + 1])]
+
+    def load(self, mmap_mode='r'):
+        '''
+        Returns (values, step_offsets, sample_offsets), memory-mapped by
+        default (no copy). Reading values start to end goes through every
+        step of every sample in order.
+        '''
+        #
+        values, step_offsets = self.steps.load(mmap_mode)
+        #
+        return values, step_offsets, load(self.samples_file, mmap_mode=mmap_mode)
+
+    def remove(self):
+        #
+        self.steps.remove()
+        remove_file(self.samples_file)
+        #
+        return
+
+    def save_compressed(self, file_name):
+        '''
+        Writes the archive to a single compressed .npz file (values,
+        step_offsets, sample_offsets), e.g. for transfer. Compressed
+        archives cannot be memory-mapped.
+        '''
+        #
+        values, step_offsets, sample_offsets = self.load()
+        savez_compressed(file_name, values=values, step_offsets=step_offsets, sample_offsets=sample_offsets)
+        #
+        return
+
+    def truncate(self, num_samples):
+        '''
+        Cuts the archive back to its first num_samples samples. Returns the
+        number of samples kept, which is smaller if the archive is shorter.
+        '''
+        #
+        if not self.exists():
+            return 0
+        sample_offsets = load(self.samples_file)
+        num_kept = min(num_samples, len(sample_offsets) - 1)
+        write_array(self.samples_file, sample_offsets[:0], num_kept + 1)
+        self.steps.truncate(sample_offsets[num_kept])
+        #
+        return num_kept
@@ -0,0 +1,79 @@
+from numpy import asarray, zeros, arange, cumsum, sqrt, take_along_axis, broadcast_to, where, float64
+
+
+def pad_spectra(spectra, num_eigenvalues=None):
+    '''
+    Stacks spectra of different lengths (e.g. the steps of a perturbation
+    sequence) into the rows of a matrix, padded at the end with zeros to
+    num_eigenvalues (default: the longest), and returns it with the
+    length of each spectrum.
+    '''
+    #
+    lengths = asarray([len(s) for s in spectra], dtype=int)
+    num_eigenvalues = (lengths.max() if len(lengths) > 0 else 0) if num_eigenvalues is None else num_eigenvalues
+    matrix = zeros((len(spectra), num_eigenvalues))
+    for i, s in enumerate(spectra):
+        matrix[i, :lengths[i]] = s
+    #
+    return matrix, lengths
+
+
+def get_bulk_indices(spectra, lengths):
+    '''
+    Vectorized graph_wrapper.get_bulk_index: returns, for every spectrum
+    (descending, zero padded, along the last axis of spectra), the first
+    index at which the running sum exceeds 95% of the spectral sum, or
+    its length if none does. Ties are resolved with the same slack.
+    '''
+    #
+    running_sums = cumsum(spectra, axis=-1)
+    cut_offs = 0.95 * spectra.sum(axis=-1) * (1 + 1e-12)
+    exceeds = (running_sums > cut_offs[..., None]) & (arange(spectra.shape[-1]) < lengths[..., None])
+    #
+    return where(exceeds.any(axis=-1), exceeds.argmax(axis=-1), lengths)
+
+
+def get_trajectory_metrics(spectra, lengths, target_spectra):
+    '''
+    Computes the bulk index, rss, isd and tss of every step of one or
+    more perturbation sequences at once, as assess_similarity would step
+    by step. spectra is a zero padded (steps x n) matrix for a sequence,
+    or a (samples x steps x n) tensor for a batch (see pad_spectra), and
+    lengths holds the length of each spectrum. target_spectra is the
+    target spectrum (n,) of the sequence, or (samples x n) for a batch,
+    zero padded likewise. Padded steps (length 0) come out as rss 0,
+    isd 1 and tss 0. Returns (bulk_indices, rss, isd, tss), each shaped
+    like lengths.
+    '''
+    #
+    spectra = asarray(spectra, dtype=float64)
+    lengths = asarray(lengths)
+    target_spectra = asarray(target_spectra, dtype=float64)
+    if spectra.ndim == 3:
+        target_spectra = target_spectra[:, None, :]
+    #
+    # Targets are at least as long as their perturbed spectra
+    n = target_spectra.shape[-1]
+    if spectra.shape[-1] < n:
+        padded = zeros(spectra.shape[:-1] + (n,))
+        padded[..., :spectra.shape[-1]] = spectra
+        spectra = padded
+    bulk_indices = get_bulk_indices(spectra, lengths)
+    #
+    # Norms of the target spectra cut at the bulk indices, from running
+    # sums of squares (index 0 for the empty cut)
+    squared_sums = broadcast_to(cumsum(target_spectra**2, axis=-1), spectra.shape)
+    reduced_squared_sums = take_along_axis(squared_sums, (bulk_indices - 1).clip(0)[..., None], axis=-1)[..., 0]
+    reduced_target_norms = sqrt(where(bulk_indices > 0, reduced_squared_sums, 0.0))
+    target_norms = sqrt(squared_sums[..., -1])
+    #
+    # Reduced Spectral Similarity (0 where the reduced target vanishes)
+    mask = arange(n) < bulk_indices[..., None]
+    discrepancy_norms = sqrt((((spectra - target_spectra) * mask)**2).sum(axis=-1))
+    rss = where(reduced_target_norms > 0.0, 1.0 - discrepancy_norms / where(reduced_target_norms > 0.0, reduced_target_norms, 1.0), 0.0)
+    #
+    # Irreconcilable Spectral Dissimilarity and Total Spectral Similarity
+    isd = 1.0 - reduced_target_norms / target_norms
+    tss = (1.0 - isd) * rss
+    #
+    return bulk_indices, rss, isd, tss
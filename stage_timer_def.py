@@ -0,0 +1,132 @@
+from time import perf_counter
+import csv
+import json
+
+
+class stage_timer(object):
+    #
+    #
+    def __init__(self):
+        '''
+        Accumulates wall time and call counts of the stages of perturbation
+        sequences (see the timing stage specifications in constants), per
+        (step, stage), summed over samples: the timer grows with the
+        number of steps, not with the number of samples. Stages are timed
+        with
+
+            with timer.time(SPECTRUM_STAGE, step):
+                ...
+
+        which costs about a microsecond, or recorded with record when timed
+        elsewhere (e.g. a batched solve, shared among its samples). Timed
+        stages must not be nested.
+        '''
+        #
+        self.seconds = {}
+        self.calls = {}
+        self.key = None
+        self.start = None
+        #
+        return
+
+    def __enter__(self):
+        #
+        self.start = perf_counter()
+        #
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        #
+        self.record(*self.key, seconds=perf_counter() - self.start)
+        #
+        return False
+
+    def get_records(self):
+        '''
+        Returns [step, stage, calls, seconds] for every timed (step,
+        stage), sorted.
+        '''
+        #
+        return [[step, stage, self.calls[(step, stage)], self.seconds[(step, stage)]] for (step, stage) in sorted(self.seconds)]
+
+    def get_stage_totals(self):
+        '''
+        Returns, for each stage, its total calls and seconds, and its
+        fraction of the time of all stages.
+        '''
+        #
+        totals = {}
+        for (step, stage), seconds in self.seconds.items():
+            calls, total = totals.get(stage, (0, 0.0))
+            totals[stage] = (calls + self.calls[(step, stage)], total + seconds)
+        all_seconds = sum(seconds for calls, seconds in totals.values())
+        #
+        return dict((stage, {"calls": calls, "seconds": seconds, "fraction": seconds / all_seconds if all_seconds > 0 else 0.0})
+                    for stage, (calls, seconds) in totals.items())
+
+    def merge(self, other):
+        #
+        # E.g. the timer of a worker process
+        for (step, stage), seconds in other.seconds.items():
+            self.record(stage, step, seconds, other.calls[(step, stage)])
+        #
+        return
+
+    def record(self, stage, step=0, seconds=0.0, calls=1):
+        #
+        key = (step, stage)
+        self.seconds[key] = self.seconds.get(key, 0.0) + seconds
+        self.calls[key] = self.calls.get(key, 0) + calls
+        #
+        return
+
+    def save_csv(self, file_name):
+        #
+        with open(file_name, 'w') as f:
+            writer = csv.writer(f, delimiter=",")
+            writer.writerow(["step", "stage", "calls", "seconds"])
+            for row in self.get_records():
+                writer.writerow(row)
+        #
+        return
+
+    def save_json(self, file_name):
+        #
+        with open(file_name, 'w') as f:
+            json.dump({"stages": self.get_stage_totals(), "records": self.get_records()}, f)
+        #
+        return
+
+    def time(self, stage, step=0):
+        #
+        self.key = (stage, step)
+        #
+        return self
+
+
+class null_timer(object):
+    #
+    #
+    def __init__(self):
+        '''
+        The default timer, which times nothing, so that the timed stages
+        need no checks whether timing is on.
+        '''
+        #
+        return
+
+    def __enter__(self):
+        #
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        #
+        return False
+
+    def record(self, stage, step=0, seconds=0.0, calls=1):
+        #
+        return
+
+    def time(self, stage, step=0):
+        #
+        return self
@@ -0,0 +1,220 @@
+from numpy import zeros, full, arange, asarray, sqrt, cumsum, clip, floor, add, minimum, maximum, concatenate, savez_compressed,\
+    load, float64, int64
+from trajectory_store_def import get_padded_matrix
+from os import replace, fsync
+from os.path import exists
+from statistics import NormalDist
+
+
+class step_statistics(object):
+    #
+    #
+    def __init__(self, fill_value=0, num_bins=100, low=0.0, high=1.0):
+        '''
+        Running statistics of trajectories (e.g. the rss of every sample)
+        at each step index, across samples: count, mean and sum of squared
+        deviations (merged batch-wise after Chan et al., which is stable),
+        and a histogram of num_bins bins over [low, high] as a quantile
+        sketch. Memory grows with the number of steps, not of samples.
+
+        Shorter trajectories count as padded with fill_value up to the
+        longest one, like the matrices of visualization_utils; the padding
+        is accounted for when the statistics are queried.
+        '''
+        #
+        self.fill_value = fill_value
+        self.num_bins = num_bins
+        self.low = low
+        self.high = high
+        self.num_samples = 0
+        self.count = zeros(0, dtype=int64)
+        self.mean = zeros(0)
+        self.m2 = zeros(0)
+        self.histogram = zeros((0, num_bins), dtype=int64)
+        #
+        return
+
+    def add(self, trajectories):
+        #
+        if len(trajectories) == 0:
+            return
+        trajectories = [asarray(t, dtype=float64).ravel() for t in trajectories]
+        lengths = asarray([len(t) for t in trajectories])
+        #
+        # Statistics of the batch at each step
+        batch = get_padded_matrix(concatenate(trajectories), concatenate([[0], cumsum(lengths)]), fill_value=0.0)
+        mask = arange(batch.shape[1]) < lengths[:, None]
+        self.extend(batch.shape[1])
+        batch_count = mask.sum(axis=0)
+        batch_mean = batch.sum(axis=0) / batch_count
+        batch_m2 = (((batch - batch_mean) * mask)**2).sum(axis=0)
+        #
+        # Merge with the running statistics
+        steps = slice(0, batch.shape[1])
+        count = self.count[steps] + batch_count
+        delta = batch_mean - self.mean[steps]
+        self.mean[steps] += delta * batch_count / count
+        self.m2[steps] += batch_m2 + delta**2 * self.count[steps] * batch_count / count
+        self.count[steps] = count
+        self.num_samples += len(trajectories)
+        #
+        # Sketch
+        rows, steps = mask.nonzero()
+        add.at(self.histogram, (steps, self.get_bins(batch[rows, steps])), 1)
+        #
+        return
+
+    def extend(self, num_steps):
+        #
+        num_new = num_steps - len(self.count)
+        if num_new <= 0:
+            return
+        self.count = concatenate([self.count, zeros(num_new, dtype=int64)])
+        self.mean = concatenate([self.mean, zeros(num_new)])
+        self.m2 = concatenate([self.m2, zeros(num_new)])
+        self.histogram = concatenate([self.histogram, zeros((num_new, self.num_bins), dtype=int64)])
+        #
+        return
+
+    def get_bins(self, values):
+        #
+        bins = floor((asarray(values) - self.low) / (self.high - self.low) * self.num_bins)
+        #
+        return clip(bins, 0, self.num_bins - 1).astype(int64)
+
+    def get_confidence_width(self, confidence=0.95):
+        '''
+        Returns the width of the (normal) confidence interval of the mean
+        at each step, at the given confidence level, from the sample
+        standard deviation (so 0 with fewer than two samples).
+        '''
+        #
+        if self.num_samples < 2:
+            return zeros(len(self.count))
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        #
+        return 2 * z * sqrt(self.get_variance() / (self.num_samples - 1))
+
+    def get_mean(self):
+        #
+        num_padded = self.num_samples - self.count
+        #
+        return (self.count * self.mean + num_padded * self.fill_value) / self.num_samples
+
+    def get_quantile(self, q):
+        '''
+        Returns the q-quantile at each step, interpolated linearly within
+        the histogram bin containing it (so to within one bin width).
+        '''
+        #
+        histogram = self.histogram.copy()
+        histogram[arange(len(histogram)), self.get_bins(full(len(histogram), self.fill_value))] += self.num_samples - self.count
+        cumulative = cumsum(histogram, axis=1)
+        target = q * self.num_samples
+        bins = minimum((cumulative < target).sum(axis=1), self.num_bins - 1)
+        steps = arange(len(histogram))
+        below = cumulative[steps, bins] - histogram[steps, bins]
+        fraction = clip((target - below) / histogram[steps, bins].clip(1), 0.0, 1.0)
+        #
+        return self.low + (bins + fraction) * (self.high - self.low) / self.num_bins
+
+    def get_std(self):
+        #
+        return sqrt(self.get_variance())
+
+    def get_variance(self):
+        '''
+        Returns the (population) variance at each step, padding included:
+        the padding is merged in as a group with zero variance.
+        '''
+        #
+        num_padded = self.num_samples - self.count
+        m2 = self.m2 + (self.mean - self.fill_value)**2 * self.count * num_padded / self.num_samples
+        #
+        return m2 / self.num_samples
+
+
+def update_step_axis(step_axis, step_indices):
+    '''
+    Returns the step axis (the perturbation step of each trajectory
+    column, the largest over the samples so far) after adding the step
+    indices of one more sample (see experiment's stride and fractions).
+    '''
+    #
+    step_indices = asarray(step_indices, dtype=int64)
+    axis = zeros(max(len(step_axis), len(step_indices)), dtype=int64)
+    axis[:len(step_axis)] = step_axis
+    axis[:len(step_indices)] = maximum(axis[:len(step_indices)], step_indices)
+    #
+    return axis
+
+
+def save_summary(file_name, statistics, step_axis=None):
+    '''
+    Writes a dict of step_statistics (keyed by metric) to the compressed
+    .npz file file_name, atomically (through a temporary file), along
+    with the step axis of the same samples, if given (see
+    update_step_axis).
+    '''
+    #
+    arrays = {}
+    for name, s in statistics.items():
+        arrays[f"{name}_settings"] = asarray([s.fill_value, s.num_bins, s.low, s.high, s.num_samples], dtype=float64)
+        arrays[f"{name}_count"] = s.count
+        arrays[f"{name}_mean"] = s.mean
+        arrays[f"{name}_m2"] = s.m2
+        arrays[f"{name}_histogram"] = s.histogram
+    if step_axis is not None:
+        arrays["step_axis"] = asarray(step_axis, dtype=int64)
+        arrays["step_axis_num_samples"] = asarray(max([s.num_samples for s in statistics.values()] + [0]), dtype=int64)
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, 'wb') as f:
+        savez_compressed(f, **arrays)
+        f.flush()
+        fsync(f.fileno())
+    replace(temp_file_name, file_name)
+    #
+    return
+
+
+def load_summary(file_name):
+    '''
+    Returns the dict of step_statistics saved in file_name, or None if
+    there is no such file.
+    '''
+    #
+    if not exists(file_name):
+        return None
+    statistics = {}
+    with load(file_name) as arrays:
+        for key in arrays.files:
+            if not key.endswith("_settings"):
+                continue
+            name = key[:-len("_settings")]
+            fill_value, num_bins, low, high, num_samples = arrays[key]
+            s = step_statistics(fill_value, int(num_bins), low, high)
+            s.num_samples = int(num_samples)
+            s.count = arrays[f"{name}_count"]
+            s.mean = arrays[f"{name}_mean"]
+            s.m2 = arrays[f"{name}_m2"]
+            s.histogram = arrays[f"{name}_histogram"]
+            statistics[name] = s
+        #
+    #
+    return statistics
+
+
+def load_step_axis(file_name, num_samples):
+    '''
+    Returns the step axis saved in file_name (see save_summary) if it
+    covers num_samples samples, or else None.
+    '''
+    #
+    if not exists(file_name):
+        return None
+    with load(file_name) as arrays:
+        if "step_axis" not in arrays.files or int(arrays["step_axis_num_samples"]) != num_samples:
+            return None
+        step_axis = arrays["step_axis"]
+    #
+    return step_axis
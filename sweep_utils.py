@@ -0,0 +1,399 @@
+from collections import namedtuple
+from heapq import heapify, heapreplace
+from itertools import product
+from multiprocessing import Pool, cpu_count
+from traceback import format_exc
+from time import perf_counter
+from os.path import join, dirname
+from os import makedirs
+from platform import node
+from numpy.linalg import eigh
+from numpy import asarray, log, exp, interp, maximum, float64
+from numpy.random import default_rng
+from experiment_def import experiment, check_checkpoint
+from graph_wrapper_def import get_evaluation_steps
+from graph_wrappers import graph_spec_dict
+from trajectory_store_def import read_checkpoint
+from constants import NODE, EDGE, data_dir, root_dir
+from utils import read_json, dump_json
+import json
+
+sweep_task = namedtuple("sweep_task", ["experiment_index", "experiment_kwargs", "start", "stop", "batch_size", "seconds"])
+sweep_failure = namedtuple("sweep_failure", ["experiment_kwargs", "start", "stop", "traceback"])
+sweep_job = namedtuple("sweep_job", ["experiment_kwargs", "num_samples", "graph_spec"])
+job_cost = namedtuple("job_cost", ["job", "num_recorded", "num_steps", "sample_seconds", "seconds", "error"])
+
+#
+# Matrix sizes at which dense eigensolves are timed for the cost model,
+# and their seconds (measured once per machine, on first use, and kept
+# in solve_seconds_file, keyed by host name, so that every sweep and dry
+# run on it agrees; the file is machine-specific and left out of git)
+solve_sizes = [4, 8, 16, 32, 64, 128, 256]
+solve_seconds = []
+solve_seconds_file = join(root_dir, ".cache", "solve_seconds.json")
+
+
+def get_sweep_tasks(experiment_kwargs_list, num_samples, samples_per_task=10, batch_size=1, first_samples=None, sample_seconds=None, max_task_seconds=None):
+    '''
+    Splits the samples of every experiment into tasks of samples_per_task
+    samples. Experiment k runs from sample first_samples[k] (default: 0)
+    up to num_samples, or num_samples[k] if a list, and each of its
+    samples is estimated to take sample_seconds[k] (default: unknown, 0).
+    With max_task_seconds, tasks of expensive experiments get fewer
+    samples, so that none is estimated to take longer (unless it has a
+    single sample).
+    '''
+    #
+    tasks = []
+    for k, experiment_kwargs in enumerate(experiment_kwargs_list):
+        first_sample = 0 if first_samples is None else first_samples[k]
+        last_sample = num_samples[k] if isinstance(num_samples, list) else num_samples
+        seconds = 0.0 if sample_seconds is None else sample_seconds[k]
+        task_size = samples_per_task
+        if max_task_seconds is not None and seconds > 0:
+            task_size = max(1, min(samples_per_task, int(max_task_seconds / seconds)))
+        for start in range(first_sample, last_sample, task_size):
+            stop = min(start + task_size, last_sample)
+            tasks.append(sweep_task(k, experiment_kwargs, start, stop, batch_size, (stop - start) * seconds))
+        #
+    #
+    return tasks
+
+
+def schedule_sweep_tasks(experiment_kwargs_list, num_samples, first_samples, sample_seconds, samples_per_task=10, batch_size=1,
+                         num_workers=1, largest_first=True):
+    '''
+    Returns the tasks of a sweep (see get_sweep_tasks), in the order
+    perform_sweep hands them out, and their total estimated seconds. With
+    largest_first, tasks are cut down to a tenth of the estimated cost
+    per worker and the most expensive go first.
+    '''
+    #
+    total_seconds = sum(max(num_samples[k] - first_samples[k], 0) * sample_seconds[k] for k in range(len(experiment_kwargs_list)))
+    max_task_seconds = total_seconds / (10 * num_workers) if largest_first else None
+    tasks = get_sweep_tasks(experiment_kwargs_list, num_samples, samples_per_task, batch_size, first_samples, sample_seconds, max_task_seconds)
+    if largest_first:
+        tasks.sort(key=lambda task: task.seconds, reverse=True)
+    #
+    return tasks, total_seconds
+
+
+def get_makespan(task_seconds, num_processes):
+    '''
+    Returns the seconds until the last of the tasks is done, when each is
+    handed in the given order to whichever of num_processes processes
+    frees up first (as Pool.imap_unordered does).
+    '''
+    #
+    finish_times = [0.0] * num_processes
+    heapify(finish_times)
+    for seconds in task_seconds:
+        heapreplace(finish_times, finish_times[0] + seconds)
+    #
+    return max(finish_times)
+
+
+def perform_sweep_task(task):
+    '''
+    Runs samples [start, stop) of one experiment in a worker process and
+    returns them without writing anything, along with the worker's timer
+    (see experiment) and the traceback if the task failed. Every sample has its own random streams (see
+    experiment.get_sample_streams), so the results do not depend on how
+    the samples are split into tasks.
+    '''
+    #
+    try:
+        exp = experiment(record=False, **task.experiment_kwargs)
+        samples = list(exp.run_samples(task.stop - task.start, batch_size=task.batch_size, first_sample=task.start))
+    except Exception:
+        return task, None, None, format_exc()
+    #
+    return task, samples, exp.timer, None
+
+
+def perform_sweep(experiment_kwargs_list, num_samples, samples_per_task=10, num_processes=None, batch_size=1, largest_first=True):
+    '''
+    Performs num_samples samples of every experiment in
+    experiment_kwargs_list (the kwargs of experiment, e.g.
+    {"graph_family": COMPLETE, "perturbation_type": NODE, "num_nodes": 10}),
+    or num_samples[k] samples of experiment k if num_samples is a list.
+    Samples are fanned out over a pool of num_processes worker processes
+    (default: one per core) in tasks of samples_per_task samples.
+
+    Only this process writes data files, in sample order. Samples
+    already recorded by an earlier (interrupted or smaller) sweep are
+    kept, and only the missing ones are computed (see
+    experiment.restore_checkpoint). Samples of a failed task, and the
+    later samples of its experiment, are left out (to be run by the next
+    sweep) and the traceback is reported; all failures are returned as a
+    list of sweep_failure.
+
+    The cost of every task is estimated up front (see
+    estimate_sample_seconds). With largest_first, the most expensive
+    tasks are handed out first, so that no large task is left to run on
+    its own at the end (longest processing time first scheduling), and
+    tasks are cut down to a tenth of the estimated cost per process (see
+    schedule_sweep_tasks). The progress report includes an ETA, from the
+    estimated cost left and the rate at which the estimated cost has
+    been done so far.
+    '''
+    #
+    # Set up the data files of every experiment
+    num_samples = num_samples if isinstance(num_samples, list) else [num_samples] * len(experiment_kwargs_list)
+    failures = []
+    experiments = {}
+    for k, experiment_kwargs in enumerate(experiment_kwargs_list):
+        try:
+            experiments[k] = experiment(**experiment_kwargs)
+        except Exception:
+            failures.append(sweep_failure(experiment_kwargs, 0, num_samples[k], format_exc()))
+            print(f"...setting up {experiment_kwargs} FAILED:\n{failures[-1].traceback}")
+            continue
+        if experiments[k].num_recorded > 0:
+            print(f"Resuming {experiments[k].graph_wrapper.name} ({experiments[k].perturbation_type}) at sample {experiments[k].num_recorded}")
+        #
+    #
+    # Experiments that failed to set up get no tasks
+    first_samples = [experiments[k].num_recorded if k in experiments else num_samples[k] for k in range(len(experiment_kwargs_list))]
+    sample_seconds = [estimate_experiment_seconds(experiments[k]) if k in experiments else 0.0 for k in range(len(experiment_kwargs_list))]
+    num_workers = cpu_count() if num_processes is None else num_processes
+    tasks, total_seconds = schedule_sweep_tasks(experiment_kwargs_list, num_samples, first_samples, sample_seconds, samples_per_task, batch_size,
+                                                num_workers, largest_first)
+    print(f"{len(tasks)} tasks, estimated ~{total_seconds:.0f} core seconds, ~{get_makespan([task.seconds for task in tasks], num_workers):.0f}s on {num_workers} processes")
+    #
+    # Tasks finish in any order; results are held back until
+    # all earlier samples of the same experiment are recorded
+    next_sample = dict((k, exp.num_recorded) for k, exp in experiments.items())
+    pending = dict((k, {}) for k in experiments)
+    start_time = perf_counter()
+    seconds_done = 0.0
+    with Pool(num_processes) as pool:
+        for num_done, (task, samples, timer, error) in enumerate(pool.imap_unordered(perform_sweep_task, tasks)):
+            exp = experiments[task.experiment_index]
+            description = f"samples {task.start}-{task.stop - 1} of {exp.graph_wrapper.name} ({exp.perturbation_type})"
+            seconds_done += task.seconds
+            elapsed = perf_counter() - start_time
+            eta = f", ETA {(total_seconds - seconds_done) * elapsed / seconds_done:.0f}s" if seconds_done > 0 else ""
+            if error is not None:
+                failures.append(sweep_failure(task.experiment_kwargs, task.start, task.stop, error))
+                print(f"...{description} FAILED [{num_done + 1}/{len(tasks)}{eta}]:\n{error}")
+            else:
+                print(f"Finished {description} [{num_done + 1}/{len(tasks)}{eta}]")
+                if exp.timing:
+                    exp.timer.merge(timer)
+            #
+            # Recording stops at a failed task (samples None), since
+            # samples can only be recorded in order
+            pending[task.experiment_index][task.start] = (task.stop, samples)
+            while next_sample[task.experiment_index] in pending[task.experiment_index]:
+                start = next_sample[task.experiment_index]
+                if pending[task.experiment_index][start][1] is None:
+                    break
+                stop, samples = pending[task.experiment_index].pop(start)
+                exp.record_samples(start, samples)
+                next_sample[task.experiment_index] = stop
+            #
+        #
+    #
+    for exp in experiments.values():
+        exp.save_summary()
+        exp.save_timing()
+    #
+    return failures
+
+
+def read_sweep_spec(file_name):
+    '''
+    Reads a sweep spec (see expand_sweep_spec) from the json file
+    file_name. Besides the sweeps, a spec may set samples_per_task,
+    num_processes and batch_size (see perform_sweep).
+    '''
+    #
+    with open(file_name, 'r') as f:
+        spec = json.load(f)
+    if "sweeps" not in spec:
+        raise Exception("Sweep spec %s lists no sweeps." % file_name)
+    #
+    return spec
+
+
+def expand_sweep_spec(spec):
+    '''
+    Expands a sweep spec into a list of sweep_job, one per experiment,
+    each with the graph_spec of its graph.
+    A spec is a dict like
+
+        {
+            "num_samples": 100,
+            "options": {"stride": 2},
+            "sweeps": [
+                {"graph_family": "star", "kwargs": {"num_leaves": [5, 10, 20]}},
+                {"graph_family": "path", "kwargs": {"num_nodes": [100, 400]},
+                 "options": {"spectral_engine": "component"}},
+                {"graph_family": "random_binomial", "perturbation_types": ["edge"],
+                 "kwargs": {"num_nodes": [20, 50], "edge_prob": [0.1, 0.5]}, "num_samples": 50},
+                {"graph_family": "complete_bipartite",
+                 "kwargs_list": [{"num_nodes_C1": 5, "num_nodes_C2": 10}]}
+            ]
+        }
+
+    Every sweep runs every combination of its kwargs grid (lists are
+    grid axes, anything else a fixed value), or every entry of its
+    kwargs_list, for each of its perturbation_types (default: node and
+    edge). num_samples and options (further kwargs of experiment) apply
+    to all sweeps unless a sweep sets its own. The graph kwargs are
+    checked against graph_spec_dict, without generating any graph.
+    '''
+    #
+    jobs = []
+    for sweep in spec["sweeps"]:
+        #
+        # Make sure valid choice
+        graph_family = sweep["graph_family"]
+        if graph_family not in graph_spec_dict:
+            raise Exception("Invalid graph family, %s, specified. Must be one of %s." % (graph_family, list(graph_spec_dict)))
+        perturbation_types = sweep.get("perturbation_types", [NODE, EDGE])
+        for perturbation_type in perturbation_types:
+            if perturbation_type not in [NODE, EDGE]:
+                raise Exception("Invalid perturbation type, %s, specified. Must be either %s or %s." % (perturbation_type, NODE, EDGE))
+            #
+        #
+        # Grid axes are the kwargs given as lists
+        if "kwargs_list" in sweep:
+            kwargs_list = sweep["kwargs_list"]
+        else:
+            grid = dict((k, v if isinstance(v, list) else [v]) for k, v in sweep.get("kwargs", {}).items())
+            kwargs_list = [dict(zip(grid, values)) for values in product(*grid.values())]
+        graph_specs = []
+        for kwargs in kwargs_list:
+            try:
+                graph_specs.append(graph_spec_dict[graph_family](**kwargs))
+            except TypeError as e:
+                raise Exception("Invalid kwargs, %s, specified for %s: %s" % (kwargs, graph_family, e))
+            #
+        #
+        options = dict(spec.get("options", {}), **sweep.get("options", {}))
+        num_samples = sweep.get("num_samples", spec.get("num_samples"))
+        if num_samples is None:
+            raise Exception("No num_samples specified for the %s sweep." % graph_family)
+        for perturbation_type in perturbation_types:
+            for kwargs, graph_spec in zip(kwargs_list, graph_specs):
+                jobs.append(sweep_job(dict(options, graph_family=graph_family, perturbation_type=perturbation_type, **kwargs), num_samples, graph_spec))
+            #
+        #
+    #
+    return jobs
+
+
+def get_solve_seconds(n, repeats=5):
+    '''
+    Returns the estimated seconds of a dense eigensolve of n x n matrices
+    (n may be an array), interpolated in log-log space between the
+    solves timed at solve_sizes on this machine, and extrapolated along
+    the last segment beyond them.
+    '''
+    #
+    if len(solve_seconds) == 0:
+        cached = read_json(solve_seconds_file) or {}
+        host_cached = cached.get(node())
+        if host_cached is not None and host_cached["solve_sizes"] == solve_sizes:
+            solve_seconds.extend(host_cached["solve_seconds"])
+        #
+    if len(solve_seconds) == 0:
+        for size in solve_sizes:
+            a = default_rng(0).random((size, size))
+            a = a + a.T
+            seconds = []
+            for r in range(repeats):
+                start = perf_counter()
+                eigh(a)
+                seconds.append(perf_counter() - start)
+            solve_seconds.append(min(seconds))
+        #
+        cached[node()] = {"solve_sizes": solve_sizes, "solve_seconds": solve_seconds}
+        makedirs(dirname(solve_seconds_file), exist_ok=True)
+        dump_json(solve_seconds_file, cached)
+        #
+    #
+    x = log(asarray(solve_sizes, dtype=float))
+    y = log(asarray(solve_seconds))
+    slope = (y[-1] - y[-2]) / (x[-1] - x[-2])
+    log_n = log(maximum(asarray(n, dtype=float), 1.0))
+    #
+    return exp(interp(log_n, x, y) + slope * maximum(log_n - x[-1], 0.0))
+
+
+def estimate_sample_seconds(expected_nodes, expected_edges, perturbation_type, stride=1, fractions=None):
+    '''
+    Returns the estimated seconds of one sample (a full perturbation
+    sequence) of a graph with the given expected numbers of nodes and
+    edges (see graph_wrappers): two dense eigensolves (spectrum and
+    eigencentrality) per evaluation step (see
+    graph_wrapper_def.get_evaluation_steps). Node perturbations shrink
+    the graph by a node per removal, edge perturbations leave it at
+    about the full size. This is an upper bound for sequences that end
+    early (e.g. a star losing its center) and for the incremental
+    engines.
+    '''
+    #
+    num_nodes = max(int(round(expected_nodes)), 2)
+    if perturbation_type == NODE:
+        sizes = num_nodes - get_evaluation_steps(num_nodes, stride, fractions)
+        return float(2 * get_solve_seconds(sizes[sizes >= 2]).sum())
+    #
+    num_edges = int(round(expected_edges))
+    #
+    return float(2 * (len(get_evaluation_steps(num_edges, stride, fractions)) - 1) * get_solve_seconds(num_nodes))
+
+
+def estimate_experiment_seconds(exp):
+    #
+    return estimate_sample_seconds(exp.graph_wrapper.expected_nodes, exp.graph_wrapper.expected_edges, exp.perturbation_type, exp.stride, exp.fractions)
+
+
+def estimate_sweep_cost(jobs):
+    '''
+    Returns a job_cost for every sweep_job: the samples it has recorded
+    already (read from its checkpoint, without creating anything), the
+    steps of each of its samples, and estimates of the seconds of one
+    sample and of all its missing samples on one core (see
+    estimate_sample_seconds). A job whose checkpoint was recorded with
+    other settings fails to set up in perform_sweep, so it costs nothing
+    and its error is the reason.
+    '''
+    #
+    costs = []
+    for job in jobs:
+        spec = job.graph_spec
+        kwargs = job.experiment_kwargs
+        perturbation_type = kwargs["perturbation_type"]
+        dir_name = join(kwargs.get("data_root", data_dir), spec.graph_family, perturbation_type, spec.name)
+        checkpoint = None if kwargs.get("overwrite", False) else read_checkpoint(dir_name)
+        num_recorded = 0 if checkpoint is None else min(checkpoint["num_samples"], job.num_samples)
+        error = None
+        if checkpoint is not None:
+            try:
+                check_checkpoint(checkpoint, dir_name, kwargs.get("seed"), kwargs.get("spectra_dtype", float64), kwargs.get("stride", 1), kwargs.get("fractions"))
+            except Exception as e:
+                error = str(e)
+            #
+        #
+        num_nodes = int(round(spec.expected_nodes))
+        num_steps = max(num_nodes - 1, 1) if perturbation_type == NODE else int(round(spec.expected_edges))
+        sample_seconds = 0.0 if error is not None else estimate_sample_seconds(spec.expected_nodes, spec.expected_edges, perturbation_type,
+                                                                              kwargs.get("stride", 1), kwargs.get("fractions"))
+        costs.append(job_cost(job, num_recorded, num_steps, sample_seconds, (job.num_samples - num_recorded) * sample_seconds, error))
+    #
+    return costs
+
+
+def perform_sweep_jobs(jobs, samples_per_task=10, num_processes=None, batch_size=1):
+    '''
+    Performs a list of sweep_job (see expand_sweep_spec) in a single
+    perform_sweep, so that all their tasks are scheduled together, and
+    returns the failures.
+    '''
+    #
+    print(f"Kicking off {sum(job.num_samples for job in jobs)} samples of {len(jobs)} experiments")
+    #
+    return perform_sweep([job.experiment_kwargs for job in jobs], [job.num_samples for job in jobs], samples_per_task, num_processes, batch_size)
@@ -0,0 +1,296 @@
+from numpy import asarray, concatenate, cumsum, diff, full, arange, zeros, load, float64, int64
+from numpy import dtype as npdtype
+from numpy.lib.format import magic, dtype_to_descr
+from os.path import exists, join
+from os import walk
+from constants import data_dir
+from utils import remove_file, dump_json, read_json
+import struct
+import csv
+
+# Size of the .npy headers, padded so that they
+# can be rewritten in place as the arrays grow
+header_size = 128
+
+# Trajectories recorded by an experiment (per sample)
+trajectory_dtypes = {
+    "rss": float64,
+    "isd": float64,
+    "tss": float64,
+    "bulk_indices": int64,
+    "perturbation_orders": int64,
+    "step_indices": int64
+}
+
+
+class trajectory_store(object):
+    #
+    #
+    def __init__(self, file_base=None, dtype=float64):
+        '''
+        Stores ragged trajectories, one 1-d array per sample (e.g. the rss
+        along a perturbation sequence), in two .npy files: file_base +
+        "_values.npy" holds all trajectories back to back, and file_base +
+        "_offsets.npy" where each starts, plus where the last ends. Sample
+        i is values[offsets[i]:offsets[i + 1]]. Both files can be
+        memory-mapped, and both grow in place.
+        '''
+        #
+        self.values_file = file_base + "_values.npy"
+        self.offsets_file = file_base + "_offsets.npy"
+        self.dtype = npdtype(dtype)
+        #
+        return
+
+    def append(self, trajectories):
+        '''
+        Appends a list of trajectories in bulk. The values are written
+        before the offsets, so a crash never leaves offsets pointing past
+        the values.
+        '''
+        #
+        if not self.exists():
+            write_array(self.values_file, zeros(0, dtype=self.dtype))
+            write_array(self.offsets_file, zeros(1, dtype=int64))
+        elif load(self.values_file, mmap_mode='r').dtype != self.dtype:
+            raise Exception("Cannot append %s to %s, which holds %s." % (self.dtype, self.values_file, load(self.values_file, mmap_mode='r').dtype))
+        #
+        trajectories = [asarray(t, dtype=self.dtype).ravel() for t in trajectories]
+        if len(trajectories) == 0:
+            return
+        offsets = load(self.offsets_file)
+        new_offsets = offsets[-1] + cumsum([len(t) for t in trajectories], dtype=int64)
+        write_array(self.values_file, concatenate(trajectories), offsets[-1])
+        write_array(self.offsets_file, new_offsets, len(offsets))
+        #
+        return
+
+    def exists(self):
+        #
+        return exists(self.values_file) and exists(self.offsets_file)
+
+    def get_matrix(self, fill_value=0):
+        '''
+        Returns the trajectories as the rows of a matrix, padded at the end
+        with fill_value to the length of the longest one.
+        '''
+        #
+        values, offsets = self.load()
+        #
+        return get_padded_matrix(values, offsets, fill_value)
+
+    def get_num_samples(self):
+        #
+        if not self.exists():
+            return 0
+        #
+        return load(self.offsets_file, mmap_mode='r').shape[0] - 1
+
+    def get_sample(self, i):
+        #
+        values, offsets = self.load()
+        #
+        return values[offsets[i]:offsets[i + 1]]
+
+    def load(self, mmap_mode='r'):
+        '''
+        Returns (values, offsets), memory-mapped by default (no copy).
+        '''
+        #
+        return load(self.values_file, mmap_mode=mmap_mode), load(self.offsets_file, mmap_mode=mmap_mode)
+
+    def remove(self):
+        #
+        remove_file(self.values_file)
+        remove_file(self.offsets_file)
+        #
+        return
+
+    def truncate(self, num_samples):
+        '''
+        Cuts the store back to its first num_samples trajectories, dropping
+        anything written after them. Returns the number of trajectories
+        kept, which is smaller if the store is shorter.
+        '''
+        #
+        if not self.exists():
+            return 0
+        offsets = load(self.offsets_file)
+        num_kept = min(num_samples, len(offsets) - 1)
+        write_array(self.offsets_file, offsets[:0], num_kept + 1)
+        write_array(self.values_file, zeros(0, dtype=self.dtype), offsets[num_kept])
+        #
+        return num_kept
+
+
+def write_array(file_name, array, start=None):
+    '''
+    Writes the 1-d array to the .npy file file_name, starting at entry
+    start of the array in the file, and cuts the file off after it. By
+    default (start=None), the file is written from scratch.
+    '''
+    #
+    array = asarray(array)
+    with open(file_name, 'wb' if start is None else 'r+b') as f:
+        start = 0 if start is None else start
+        length = start + len(array)
+        f.seek(header_size + start * array.dtype.itemsize)
+        f.write(array.tobytes())
+        f.truncate(header_size + length * array.dtype.itemsize)
+        write_header(f, array.dtype, length)
+    #
+    return
+
+
+def write_header(f, dtype, length):
+    #
+    # A version 1.0 header: magic string, header length, padded header dict
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (dtype_to_descr(dtype), length)
+    header = header.ljust(header_size - 11) + "\n"
+    f.seek(0)
+    f.write(magic(1, 0))
+    f.write(struct.pack("<H", len(header)))
+    f.write(header.encode("latin1"))
+    #
+    return
+
+
+def get_padded_matrix(values, offsets, fill_value=0):
+    '''
+    Returns the trajectories values[offsets[i]:offsets[i + 1]] as the rows
+    of a matrix, padded at the end with fill_value to the length of the
+    longest one.
+    '''
+    #
+    lengths = diff(offsets)
+    num_columns = lengths.max() if len(lengths) > 0 else 0
+    matrix = full((len(lengths), num_columns), fill_value, dtype=values.dtype)
+    matrix[arange(num_columns) < lengths[:, None]] = values[offsets[0]:offsets[-1]]
+    #
+    return matrix
+
+
+def read_csv_trajectories(csv_file):
+    '''
+    Reads a csv file of ragged rows, one per sample (as written by
+    utils.dump_one_d_data), in a single pass and returns (values,
+    offsets) as a trajectory_store would hold them. Blank lines (as
+    written on Windows) are skipped.
+    '''
+    #
+    with open(csv_file, "r") as f:
+        trajectories = [asarray(row, dtype=float64) for row in csv.reader(f, delimiter=',') if len(row) > 0]
+    offsets = concatenate([[0], cumsum([len(t) for t in trajectories], dtype=int64)])
+    values = concatenate(trajectories) if len(trajectories) > 0 else zeros(0)
+    #
+    return values, offsets
+
+
+def convert_csv(csv_file, file_base, dtype=float64):
+    '''
+    Converts a csv file of ragged rows, one per sample (as written by
+    utils.dump_one_d_data), into a trajectory_store at file_base.
+    '''
+    #
+    values, offsets = read_csv_trajectories(csv_file)
+    trajectories = [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    store = trajectory_store(file_base, dtype)
+    store.remove()
+    store.append(trajectories)
+    #
+    return store
+
+
+def adopt_legacy_dir(dir_name):
+    '''
+    Adopts the trajectories recorded in dir_name before experiments were
+    checkpointed (see experiment.restore_checkpoint): converts the csv
+    files there that have no store yet, and writes a checkpoint for the
+    samples held by all of rss, isd and tss. Their seed and removal
+    orders are unknown, so the checkpoint records seed None and their
+    number as legacy_samples. Returns the checkpoint (the existing one,
+    if any), or None if there is no data.
+    '''
+    #
+    checkpoint_file = join(dir_name, "checkpoint.json")
+    if exists(checkpoint_file):
+        return read_json(checkpoint_file)
+    #
+    for name, dtype in trajectory_dtypes.items():
+        csv_file = join(dir_name, name + ".csv")
+        if exists(csv_file) and not trajectory_store(join(dir_name, name), dtype).exists():
+            convert_csv(csv_file, join(dir_name, name), dtype)
+        #
+    #
+    checkpoint = read_checkpoint(dir_name)
+    if checkpoint is not None:
+        dump_json(checkpoint_file, checkpoint)
+    #
+    return checkpoint
+
+
+def read_checkpoint(dir_name):
+    '''
+    Returns the checkpoint of dir_name without writing anything: the
+    existing one, if any, else the one adopt_legacy_dir would write (from
+    the stores, or the csv files they would be converted from), or None
+    if there is no data.
+    '''
+    #
+    checkpoint = read_json(join(dir_name, "checkpoint.json"))
+    if checkpoint is not None:
+        return checkpoint
+    #
+    counts = []
+    for name in ["rss", "isd", "tss"]:
+        store = trajectory_store(join(dir_name, name), trajectory_dtypes[name])
+        csv_file = join(dir_name, name + ".csv")
+        if store.exists():
+            counts.append(store.get_num_samples())
+        elif exists(csv_file):
+            counts.append(len(read_csv_trajectories(csv_file)[1]) - 1)
+        #
+    #
+    if len(counts) == 0:
+        return None
+    num_samples = min(counts) if len(counts) == 3 else 0
+    #
+    return {"num_samples": num_samples, "seed": None, "legacy_samples": num_samples, "spectra_dtype": None, "stride": 1, "fractions": None}
+
+
+def convert_data_dir(root_dir=data_dir, remove_csv=False):
+    '''
+    Converts every trajectory csv file (see trajectory_dtypes) under
+    root_dir into a trajectory_store next to it, and returns the list of
+    converted files. A csv file whose store exists already is skipped,
+    since the store may hold samples recorded after the conversion.
+    Directories without a checkpoint get one for the converted samples
+    (see adopt_legacy_dir), so that experiments extend them. With
+    remove_csv=True, the csv files are removed once converted (or
+    skipped).
+    '''
+    #
+    converted = []
+    for dir_name, sub_dir_names, file_names in walk(root_dir):
+        csv_files = []
+        for name, dtype in trajectory_dtypes.items():
+            csv_file = join(dir_name, name + ".csv")
+            if not exists(csv_file):
+                continue
+            csv_files.append(csv_file)
+            if trajectory_store(join(dir_name, name), dtype).exists():
+                print(f"Skipped {csv_file}, which is converted already")
+                continue
+            convert_csv(csv_file, join(dir_name, name), dtype)
+            converted.append(csv_file)
+            print(f"Converted {csv_file}")
+        #
+        if len(csv_files) > 0:
+            adopt_legacy_dir(dir_name)
+        if remove_csv:
+            for csv_file in csv_files:
+                remove_file(csv_file)
+            #
+        #
+    #
+    return converted
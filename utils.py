@@ -3,9 +3,10 @@ from collections import namedtuple
 from os.path import exists, join
 from os import makedirs
 from constants import data_dir
-from os import remove
+from os import remove, replace, fsync
 import csv
 import errno
+import json
 
 subplot_indices = namedtuple("subplot_indices", ["grid_size", "graph", "matrix", "spectrum"])
 
@@ -97,10 +98,37 @@ def dump_two_d_data(file_name, data):
     return
 
 
-def get_data_dir(graph_family, graph_name, perturbation_type):
+def dump_json(file_name, data):
+    '''
+    Writes data to file_name atomically: it is written to a temporary
+    file first, which then replaces file_name in one step. A reader never
+    sees a half-written file, even if the process is killed.
+    '''
+    #
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        fsync(f.fileno())
+    replace(temp_file_name, file_name)
+    #
+    return
+
+
+def read_json(file_name):
+    #
+    if not exists(file_name):
+        return None
+    with open(file_name, 'r') as f:
+        data = json.load(f)
+    #
+    return data
+
+
+def get_data_dir(graph_family, graph_name, perturbation_type, data_root=data_dir):
     #
     # Search for dir
-    parent_dir = join(data_dir, graph_family)
+    parent_dir = join(data_root, graph_family)
     desired_parent_dir = join(parent_dir, perturbation_type)
     if not exists(desired_parent_dir):
         makedirs(desired_parent_dir)
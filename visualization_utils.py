@@ -1,23 +1,27 @@
-from graph_wrappers import graph_wrapper_dict, get_complete_bipartite_graph
-from utils import get_data_dir
-from os.path import join
+from graph_wrappers import graph_wrapper_dict, graph_spec_dict, get_complete_bipartite_graph
+from utils import get_data_dir, read_json
+from trajectory_store_def import trajectory_store, get_padded_matrix, read_csv_trajectories
+from step_statistics_def import step_statistics, load_summary, load_step_axis
+from os.path import join, getmtime
 from constants import EDGE, COMPLETE, STAR, NODE, CYCLE, PATH, WHEEL, HYPER_CUBE,\
     RANDOM_BINOMIAL, REDUCED_SPECTRAL_SIMILARITY, TOTAL_SPECTRAL_SIMILARITY,\
     metric_color_maps, IRRECONCILABLE_SPECTRAL_DIFFERENCE, COMPLETE_BIPARTITE,\
-    misc_color_maps, TARGET
-from numpy import mean, var, linspace, asarray, std
+    misc_color_maps, TARGET, metric_fill_values, data_dir, STEP_INDICES
+from numpy import linspace, arange, int64
 from collections import namedtuple
-import pandas as pd
-import csv
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 import matplotlib.cm as cmx
-import numpy as np
 
 experimental_data = namedtuple("experimental_data", ["experiment_name", "expected_fractional_axis", "rss", "isd", "tss"])
+experimental_statistics = namedtuple("experimental_statistics", ["experiment_name", "expected_fractional_axis", "rss", "isd", "tss"])
 
+# Loaded trajectories, keyed by (file, fill value), along with
+# the modification time of the file when it was loaded
+trajectory_cache = {}
 
-def load_experiment(graph_family=None, perturbation_type=None, **kwargs):
+
+def load_experiment(graph_family=None, perturbation_type=None, data_root=data_dir, **kwargs):
         '''
         Different graph families take different optional kwargs:
             - complete <== num_nodes
@@ -28,32 +32,25 @@ def load_experiment(graph_family=None, perturbation_type=None, **kwargs):
             - hyper_cube <== cube_degree
             - random_binomial <== num_nodes, edge_prob
             - wheel <== num_spokes
+
+        The name and expected counts come from the graph's spec (see
+        graph_wrappers.graph_spec_dict), so the graph is never generated.
+        The data is read from under data_root (see experiment).
         '''
         #
         # Set defining options
-        graph_generator = graph_wrapper_dict[graph_family]
-        graph_wrapper = graph_generator(**kwargs)
-        experiment_name = graph_wrapper.name
-        data_dir = get_data_dir(graph_family, graph_wrapper.name, perturbation_type)
-        #
-        # Define files where data will be stored
-        rss_file = join(data_dir, "rss.csv")
-        tss_file = join(data_dir, "tss.csv")
-        isd_file = join(data_dir, "isd.csv")
-        #
-        # Get max columns
-        rss_cols = list(range(get_max_number_columns(rss_file)))
-        tss_cols = list(range(get_max_number_columns(tss_file)))
-        isd_cols = list(range(get_max_number_columns(isd_file)))
+        spec = graph_spec_dict[graph_family](**kwargs)
+        experiment_name = spec.name
+        experiment_dir = get_data_dir(graph_family, spec.name, perturbation_type, data_root)
         #
         # Retrieve data
-        rss_data = pd.read_csv(rss_file, delimiter=',', header=None, names=rss_cols).fillna(value=0).as_matrix()
-        tss_data = pd.read_csv(tss_file, delimiter=',', header=None, names=tss_cols).fillna(value=0).as_matrix()
-        isd_data = pd.read_csv(isd_file, delimiter=',', header=None, names=isd_cols).fillna(value=1).as_matrix()
+        rss_data = load_trajectories(experiment_dir, REDUCED_SPECTRAL_SIMILARITY, metric_fill_values[REDUCED_SPECTRAL_SIMILARITY])
+        tss_data = load_trajectories(experiment_dir, TOTAL_SPECTRAL_SIMILARITY, metric_fill_values[TOTAL_SPECTRAL_SIMILARITY])
+        isd_data = load_trajectories(experiment_dir, IRRECONCILABLE_SPECTRAL_DIFFERENCE, metric_fill_values[IRRECONCILABLE_SPECTRAL_DIFFERENCE])
         #
         # Get normalized axis
-        divisor = graph_wrapper.expected_nodes if perturbation_type == NODE else graph_wrapper.expected_edges
-        expected_fractional_axis = asarray(list(range(rss_data.shape[1]))) / float(divisor)
+        divisor = spec.expected_nodes if perturbation_type == NODE else spec.expected_edges
+        expected_fractional_axis = load_step_indices(experiment_dir, rss_data.shape[1]) / float(divisor)
         #
         # ["experiment_name", "expected_fractional_axis", "rss", "isd", "tss"]
         return experimental_data(
@@ -65,18 +62,92 @@ def load_experiment(graph_family=None, perturbation_type=None, **kwargs):
         )
 
 
-def get_max_number_columns(file_name):
-    #
-    max_cols = 0
-    with open(file_name, "r") as f:
-        reader = csv.reader(f, delimiter=',')
-        for row in reader:
-            if len(row) > max_cols:
-                max_cols = len(row)
+def load_experiment_statistics(graph_family=None, perturbation_type=None, data_root=data_dir, **kwargs):
+        '''
+        Like load_experiment, but returns the running statistics of each
+        metric at every step (see step_statistics_def) instead of the
+        trajectories. They come from the summary file that experiment.perform
+        saves, which is a few kilobytes, if it covers all recorded samples;
+        otherwise they are computed from the trajectories.
+        '''
+        #
+        # Set defining options
+        spec = graph_spec_dict[graph_family](**kwargs)
+        experiment_dir = get_data_dir(graph_family, spec.name, perturbation_type, data_root)
+        #
+        # Retrieve statistics
+        statistics = load_summary(join(experiment_dir, "summary.npz"))
+        checkpoint = read_json(join(experiment_dir, "checkpoint.json"))
+        step_axis = None
+        if statistics is not None and checkpoint is not None:
+            step_axis = load_step_axis(join(experiment_dir, "summary.npz"), checkpoint["num_samples"])
+        if statistics is None or checkpoint is None or any(s.num_samples != checkpoint["num_samples"] for s in statistics.values()):
+            exp_data = load_experiment(graph_family=graph_family, perturbation_type=perturbation_type, data_root=data_root, **kwargs)
+            statistics = {}
+            for metric, fill_value in metric_fill_values.items():
+                statistics[metric] = step_statistics(fill_value)
+                statistics[metric].add(getattr(exp_data, metric))
             #
         #
+        # Get normalized axis
+        divisor = spec.expected_nodes if perturbation_type == NODE else spec.expected_edges
+        num_steps = len(statistics[REDUCED_SPECTRAL_SIMILARITY].count)
+        if step_axis is None or len(step_axis) != num_steps:
+            step_axis = load_step_indices(experiment_dir, num_steps)
+        expected_fractional_axis = step_axis / float(divisor)
+        #
+        return experimental_statistics(
+            experiment_name=spec.name,
+            expected_fractional_axis=expected_fractional_axis,
+            rss=statistics[REDUCED_SPECTRAL_SIMILARITY],
+            isd=statistics[IRRECONCILABLE_SPECTRAL_DIFFERENCE],
+            tss=statistics[TOTAL_SPECTRAL_SIMILARITY]
+        )
+
+
+def load_step_indices(data_dir, num_columns):
+    '''
+    Returns the perturbation step at which each of the num_columns
+    trajectory columns was evaluated (see experiment's stride and
+    fractions), the largest over the samples, or every step if the
+    experiment predates the step index store.
+    '''
+    #
+    store = trajectory_store(join(data_dir, STEP_INDICES), dtype=int64)
+    if not store.exists():
+        return arange(num_columns)
+    #
+    step_indices = store.get_matrix(fill_value=0)
+    if step_indices.shape[0] == 0 or step_indices.shape[1] != num_columns:
+        return arange(num_columns)
+    #
+    return step_indices.max(axis=0)
+
+
+def load_trajectories(data_dir, name, fill_value=0):
+    '''
+    Returns the trajectories of all samples (e.g. name="rss") as the rows
+    of a matrix, padded with fill_value, from the binary store if there
+    (see trajectory_store_def) or else the csv file, which is parsed in a
+    single pass. Results are cached for the process until the file
+    changes; the cached matrices are read-only.
+    '''
+    #
+    store = trajectory_store(join(data_dir, name))
+    file_name = store.offsets_file if store.exists() else join(data_dir, name + ".csv")
+    mtime = getmtime(file_name)
+    key = (file_name, fill_value)
+    if key in trajectory_cache and trajectory_cache[key][0] == mtime:
+        return trajectory_cache[key][1]
+    #
+    if store.exists():
+        matrix = store.get_matrix(fill_value)
+    else:
+        matrix = get_padded_matrix(*read_csv_trajectories(file_name), fill_value=fill_value)
+    matrix.flags.writeable = False
+    trajectory_cache[key] = (mtime, matrix)
     #
-    return max_cols
+    return matrix
 
 
 def compare_experiments(graph_families=None, perturbation_type=None, measure=None, keyword_args=None, ax=None):
@@ -95,10 +166,10 @@ def compare_experiments(graph_families=None, perturbation_type=None, measure=Non
     for i in range(num_graphs):
         colorVal = scalarMap.to_rgba(i)
         kw = keyword_args[i]
-        exp_data = load_experiment(graph_family=graph_families[i], perturbation_type=perturbation_type, **kw)
+        exp_data = load_experiment_statistics(graph_family=graph_families[i], perturbation_type=perturbation_type, **kw)
         exp_name = getattr(exp_data, "experiment_name")
         x = getattr(exp_data, "expected_fractional_axis")
-        y = mean(getattr(exp_data, measure), axis=0)
+        y = getattr(exp_data, measure).get_mean()
         ax.plot(x, y, color=colorVal, label=exp_name)
     #
     # Set conditional titles
@@ -176,20 +247,20 @@ def display_uncertainty(graph_family=None, perturbation_type=None, measure=None,
     #
     # Plot the mean
     kw = keyword_args
-    exp_data = load_experiment(graph_family=graph_family, perturbation_type=perturbation_type, **kw)
+    exp_data = load_experiment_statistics(graph_family=graph_family, perturbation_type=perturbation_type, **kw)
     exp_name = getattr(exp_data, "experiment_name")
     x = getattr(exp_data, "expected_fractional_axis")
-    y = mean(getattr(exp_data, measure), axis=0)
+    y = getattr(exp_data, measure).get_mean()
     colorVal = scalarMap.to_rgba(1)
     ax.plot(x, y, color=colorVal, label=exp_name)
     #
     # Plot the upper bound
-    y_plus = y + deviations * std(getattr(exp_data, measure), axis=0)
+    y_plus = y + deviations * getattr(exp_data, measure).get_std()
     colorValPlus = scalarMap.to_rgba(2)
     ax.plot(x, y_plus, color=colorValPlus, label=f'{exp_name} (+{deviations} std.)', linestyle='--')
     #
     # Plot the lower bound
-    y_minus = y - deviations * std(getattr(exp_data, measure), axis=0)
+    y_minus = y - deviations * getattr(exp_data, measure).get_std()
     colorValMinus = scalarMap.to_rgba(0)
     ax.plot(x, y_minus, color=colorValMinus, label=f'{exp_name} (-{deviations} std.)', linestyle='--')
     #
@@ -237,10 +308,10 @@ def compare_to_uncertainty(
         ax = plt.gca()
     #
     # Plot the mean of the certain sequence
-    exp_data = load_experiment(graph_family=graph_family_certain, perturbation_type=perturbation_type, **keyword_args_certain)
+    exp_data = load_experiment_statistics(graph_family=graph_family_certain, perturbation_type=perturbation_type, **keyword_args_certain)
     exp_name = getattr(exp_data, "experiment_name")
     x = getattr(exp_data, "expected_fractional_axis")
-    y = mean(getattr(exp_data, measure), axis=0)
+    y = getattr(exp_data, measure).get_mean()
     ax.plot(x, y, 'k-.', label=exp_name)
     #
     # Plot uncertain graph